@@ -3,7 +3,6 @@
 import subprocess
 import os
 import logging
-import osmnx as ox
 
 # Loglama ayarları
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,8 +10,13 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # SUMO_HOME pathini doğru ayarla
 SUMO_HOME = r"C:\Program Files (x86)\Eclipse\Sumo"
 
+# netconvert seçenekleri (karo karo dönüştürmede de aynıları kullanılır)
+NETCONVERT_OPTIONS = []
+
 # Step 1 - OSM Verilerini İndirme
 def getMapFromOSM(place, dist, outDir, outFile):
+    # osmnx (geopandas/shapely/networkx) yavaş yüklenir, sadece indirme adımında import edilir
+    import osmnx as ox
     try:
         # Geocode
         lat, lng = ox.geocode(place)
@@ -34,10 +38,18 @@ def getMapFromOSM(place, dist, outDir, outFile):
         logging.error("OSM verileri indirme hatası: %s", str(e))
 
 # Step 2 - OSM dosyasını SUMO Ağına Dönüştürme
-def convertOSMToSUMONet(osmFile, netFile):
+# tiles=(nx, ny): büyük OSM dosyaları nx x ny karoya bölünüp paralel dönüştürülür (bkz. tiledNetBuild.py)
+# netconvertOptions verilmezse NETCONVERT_OPTIONS kullanılır
+def convertOSMToSUMONet(osmFile, netFile, tiles=None, netconvertOptions=None):
+    options = NETCONVERT_OPTIONS if netconvertOptions is None else netconvertOptions
     try:
         logging.info("OSM dosyasını SUMO ağına dönüştürüyor: %s", osmFile)
-        result = subprocess.run(['netconvert', '--osm-files', osmFile, '-o', netFile], check=True)
+        if tiles:
+            from tiledNetBuild import buildTiledNet
+            buildTiledNet(osmFile, netFile, *tiles, netconvertOptions=options)
+            logging.info("Karolar halinde dönüştürüldü: %s", netFile)
+            return
+        result = subprocess.run(['netconvert', '--osm-files', osmFile, '-o', netFile] + options, check=True)
         if result.returncode == 0:
             logging.info("Başarıyla dönüştürüldü: %s", netFile)
         else:
@@ -67,13 +79,16 @@ def generateRandomTrips(netFile, outFile, vClass, nMobiles, sTime, eTime):
         logging.error(f"Rasgele trip oluşturulurken hata: {str(e)}")
 
 # Step 3 - Trafik Yönlendirme
-def generateRoutes(netFile, tripFile, outFile):
+def generateRoutes(netFile, tripFile, outFile, keepAlternatives=False):
     try:
         logging.info(f"Yönlendirme dosyası oluşturuluyor: {outFile}")
         result = subprocess.run(['duarouter', '--net-file', netFile, '--route-files', tripFile, '--output-file', outFile], check=True, capture_output=True, text=True)
         
         if os.path.exists(outFile):
-            logging.info(f"Rota dosyası başarıyla oluşturuldu: {outFile}")
+            # Aynı rotayı kullanan araçlar tek bir <route> tanımını paylaşır; .alt.xml sadece istenirse tutulur
+            from routeCompact import compactRouteOutput
+            stats = compactRouteOutput(outFile, keepAlternatives)
+            logging.info(f"Rota dosyası başarıyla oluşturuldu: {outFile} ({stats['vehicles']} araç, {stats['routes']} farklı rota)")
         else:
             logging.error(f"Rota dosyası oluşturulamadı: {outFile}")
             logging.error(f"duarouter stderr: {result.stderr}")
@@ -117,18 +132,24 @@ def runSimulation(configFile, traceFile):
         logging.error(f"Simülasyon çalıştırılırken hata: {str(e)}")
 
 # Step 6 - İzleme Verisini NS2 Formatına Dönüştürme
-def convertTrace(traceFile, outFile):
+# extraOutputs: ek formatlar, örn. {'ns2config': ..., 'ns2activity': ..., 'omnet': ..., 'one': ..., 'bonnmotion': ...}
+def convertTrace(traceFile, outFile, extraOutputs=None):
     try:
         logging.info(f"İzleme verisi NS2 formatına dönüştürülüyor: {outFile}")
-        result = subprocess.run(['python', os.path.join(SUMO_HOME, 'tools', 'traceExporter.py'), '--fcd-input', traceFile, '--ns2mobility-output', outFile], check=True, capture_output=True, text=True)
-        
+        from traceStream import TraceAnalytics, summaryFileFor
+        from traceExport import exportTrace
+
+        # Tüm formatlar ve istatistik özeti aynı okumada üretilir
+        summaryFile = summaryFileFor(traceFile)
+        outputs = {'ns2mobility': outFile}
+        outputs.update(extraOutputs or {})
+        exportTrace(traceFile, outputs, [TraceAnalytics(summaryFile)])
+
         if os.path.exists(outFile):
             logging.info(f"NS2 dosyası başarıyla oluşturuldu: {outFile}")
+            logging.info(f"İstatistik özeti oluşturuldu: {summaryFile}")
         else:
             logging.error(f"NS2 dosyası oluşturulamadı: {outFile}")
-            logging.error(f"traceExporter stderr: {result.stderr}")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"traceExporter komutunda hata: {e.stderr}")
     except Exception as e:
         logging.error(f"İzleme verisi dönüştürülürken hata: {str(e)}")
 
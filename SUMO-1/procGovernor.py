@@ -0,0 +1,260 @@
+#!/usr/bin/python
+
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Memory-aware admission of SUMO child processes (netconvert, duarouter, sumo,
+# the python tools). Every job has a kind and a size (e.g. OSM bytes for
+# netconvert, net bytes for routing, route bytes for sumo). Its peak RSS is
+# predicted from the peaks of earlier jobs of the same kind, and a job is only
+# started when the predicted memory of all running jobs stays within the
+# budget. While jobs run, the RSS of their process trees is sampled; if the
+# budget is exceeded the newest job is paused until memory is available again.
+# Without psutil, live RSS is read from /proc (Linux); on other systems
+# admission only uses the predictions and jobs are not paused. The recorded
+# peak of a finished job is exact where os.wait4 is available (its maxrss,
+# or the largest sampled tree RSS when that is higher); elsewhere only jobs
+# that were sampled at least twice are recorded, so short jobs whose only
+# sample was taken at startup do not pull the predictions down.
+
+JOB_STATS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'job_stats.json')
+MAX_SAMPLES = 50                    # Peaks kept per job kind
+DEFAULT_BASE_RSS = 200 * 2**20      # Prediction without history: base + factor * size
+DEFAULT_RSS_PER_BYTE = 10.0
+RESUME_RATIO = 0.9                  # Paused jobs resume below this fraction of the budget
+SAMPLE_INTERVAL = 0.5               # Seconds between RSS samples
+
+def defaultMemoryBudget(fraction=0.8):
+    if psutil is not None:
+        return int(psutil.virtual_memory().total * fraction)
+    try:
+        return int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * fraction)
+    except (ValueError, OSError, AttributeError):
+        return 8 * 2**30
+
+def _procChildren():
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                # The command name may contain spaces, the ppid follows the closing parenthesis
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    return children
+
+def _procRSS(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+# Process ids of pid and all its descendants
+def _processTree(pid, children=None):
+    if psutil is not None:
+        try:
+            p = psutil.Process(pid)
+            return [pid] + [c.pid for c in p.children(recursive=True)]
+        except psutil.Error:
+            return []
+    if children is None:
+        return [pid]
+    tree, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        tree.append(p)
+        stack.extend(children.get(p, []))
+    return tree
+
+def _treeRSS(pids):
+    if psutil is not None:
+        total = 0
+        for pid in pids:
+            try:
+                total += psutil.Process(pid).memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    return sum(_procRSS(pid) for pid in pids)
+
+# Read the pipes of proc until they are closed, without waiting for it
+def _readPipes(proc):
+    output = {}
+    def read(name, stream):
+        output[name] = stream.read()
+        stream.close()
+    threads = [threading.Thread(target=read, args=(name, stream), daemon=True)
+               for name, stream in (('stdout', proc.stdout), ('stderr', proc.stderr)) if stream is not None]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return output.get('stdout'), output.get('stderr')
+
+# Wait for proc like proc.wait, returning the largest RSS of the process and its waited-for children
+def _waitMaxRSS(proc):
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    return usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+def _canMeasure():
+    return psutil is not None or os.path.isdir('/proc')
+
+def _signalTree(pids, pause):
+    for pid in pids:
+        try:
+            if psutil is not None:
+                p = psutil.Process(pid)
+                p.suspend() if pause else p.resume()
+            elif hasattr(signal, 'SIGSTOP'):
+                os.kill(pid, signal.SIGSTOP if pause else signal.SIGCONT)
+        except Exception:
+            pass
+
+class MemoryGovernor:
+    def __init__(self, budget=None, maxWorkers=None, statsFile=JOB_STATS_FILE):
+        self.budget = budget or defaultMemoryBudget()
+        self.maxWorkers = maxWorkers or os.cpu_count()
+        self.statsFile = statsFile
+        self.stats = {}
+        if os.path.exists(statsFile):
+            with open(statsFile) as f:
+                self.stats = json.load(f)
+        self.cond = threading.Condition()
+        self.tickets = itertools.count()
+        self.waiting = {}       # ticket -> predicted RSS, in arrival order
+        self.running = {}       # ticket -> job
+        self.monitor = None
+
+    # Step 1 - Predict the Peak RSS of a Job
+    def predict(self, kind, size):
+        samples = self.stats.get(kind, [])
+        if len(samples) >= 2:
+            n = len(samples)
+            mx = sum(s for s, _ in samples) / n
+            my = sum(p for _, p in samples) / n
+            var = sum((s - mx) ** 2 for s, _ in samples)
+            if var > 0:
+                slope = max(0.0, sum((s - mx) * (p - my) for s, p in samples) / var)
+                # Fit peak = a + b * size, never below the smallest peak seen
+                return max(my + slope * (size - mx), min(p for _, p in samples))
+            return my
+        if samples:
+            s, p = samples[0]
+            return p * size / s if s else p
+        return DEFAULT_BASE_RSS + DEFAULT_RSS_PER_BYTE * size
+
+    def _record(self, kind, size, peak):
+        with self.cond:
+            samples = self.stats.setdefault(kind, [])
+            samples.append([size, peak])
+            del samples[:-MAX_SAMPLES]
+            folder = os.path.dirname(self.statsFile)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            tmpFile = self.statsFile + '.tmp'
+            with open(tmpFile, 'w') as f:
+                json.dump(self.stats, f)
+            os.replace(tmpFile, self.statsFile)
+
+    # Memory held by running jobs: what they use now, or what they are expected to reach
+    def _reserved(self):
+        return sum(max(job['predicted'], job['rss']) for job in self.running.values())
+
+    # Step 2 - Admission: the oldest waiting job that fits, or any job when nothing runs
+    def _admissible(self, ticket):
+        if len(self.running) >= self.maxWorkers:
+            return False
+        if not self.running:
+            return ticket == next(iter(self.waiting))
+        free = self.budget - self._reserved()
+        for t, predicted in self.waiting.items():
+            if predicted <= free:
+                return t == ticket
+        return False
+
+    # Step 3 - Watch the Running Jobs and Pause/Resume them
+    def _monitorLoop(self):
+        while True:
+            with self.cond:
+                if not self.running:
+                    self.monitor = None
+                    return
+                jobs = list(self.running.values())
+            children = None if psutil is not None else _procChildren()
+            for job in jobs:
+                job['pids'] = _processTree(job['proc'].pid, children) or job['pids']
+                job['rss'] = _treeRSS(job['pids'])
+                job['peak'] = max(job['peak'], job['rss'])
+                job['samples'] += 1
+            with self.cond:
+                total = sum(job['rss'] for job in self.running.values())
+                active = [job for job in self.running.values() if not job['paused']]
+                paused = [job for job in self.running.values() if job['paused']]
+                if total > self.budget and len(active) > 1:
+                    newest = max(active, key=lambda job: job['ticket'])
+                    _signalTree(newest['pids'], True)
+                    newest['paused'] = True
+                elif paused and (not active or total < self.budget * RESUME_RATIO):
+                    oldest = min(paused, key=lambda job: job['ticket'])
+                    _signalTree(oldest['pids'], False)
+                    oldest['paused'] = False
+                self.cond.notify_all()
+            time.sleep(SAMPLE_INTERVAL)
+
+    # Run cmd like subprocess.run once the job fits into the memory budget
+    def run(self, cmd, kind, size, check=False, capture_output=False, **kwargs):
+        predicted = self.predict(kind, size)
+        with self.cond:
+            ticket = next(self.tickets)
+            self.waiting[ticket] = predicted
+            self.cond.wait_for(lambda: self._admissible(ticket))
+            del self.waiting[ticket]
+            if capture_output:
+                kwargs['stdout'] = kwargs['stderr'] = subprocess.PIPE
+            proc = subprocess.Popen(cmd, **kwargs)
+            job = {'ticket': ticket, 'proc': proc, 'pids': [proc.pid], 'predicted': predicted,
+                   'rss': 0, 'peak': 0, 'samples': 0, 'paused': False}
+            self.running[ticket] = job
+            if self.monitor is None and _canMeasure():
+                self.monitor = threading.Thread(target=self._monitorLoop, daemon=True)
+                self.monitor.start()
+
+        peak = None
+        try:
+            if hasattr(os, 'wait4'):
+                stdout, stderr = _readPipes(proc)
+                peak = max(_waitMaxRSS(proc), job['peak'])
+            else:
+                stdout, stderr = proc.communicate()
+        finally:
+            with self.cond:
+                del self.running[ticket]
+                self.cond.notify_all()
+        if peak is None and job['samples'] >= 2:
+            peak = job['peak']
+        if peak:
+            self._record(kind, size, peak)
+
+        if check and proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
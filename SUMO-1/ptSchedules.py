@@ -0,0 +1,168 @@
+#!/usr/bin/python
+
+import hashlib
+import json
+import math
+import os
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+SUMO_HOME = r"C:\Program Files (x86)\Eclipse\Sumo"  # Adjust this to your SUMO installation path
+
+# Per-line stop sequences and stop-to-stop travel times only depend on the
+# net, the stops, the lines and the vehicle class. They are computed once with
+# ptlines2flows.py and cached; flows for any period / time window are then
+# written from the cached table without routing or timing the lines again.
+
+PT_CACHE_DIR = os.path.join('cache', 'ptlines')
+PT_TABLE_VERSION = 2    # Part of the cache key, bump when the table layout changes
+
+# Placeholder window of the ptlines2flows run
+PLACEHOLDER_BEGIN, PLACEHOLDER_END, PLACEHOLDER_PERIOD = 0, 3600, 600
+
+# Attributes that depend on the schedule window, not on the line. They are
+# left out of the cached table and computed for every window:
+#  - flow begin: the line's departure offset is kept, relative to the window start
+#  - flow period: only for lines without a period of their own (-p is just the default)
+#  - flow end / number, route repeat / cycleTime: from the window length and the
+#    cached 'until' times (lines joined into a loop run 'number' vehicles that
+#    repeat the route, the others run until the end of the window)
+FLOW_WINDOW_ATTRS = ('begin', 'end', 'period', 'number')
+ROUTE_WINDOW_ATTRS = ('repeat', 'cycleTime')
+
+def _fileDigest(path, h):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+
+def ptCacheKey(netFile, stopFile, linesFile, vc):
+    h = hashlib.sha1()
+    for path in (netFile, stopFile, linesFile):
+        _fileDigest(path, h)
+    h.update(vc.encode())
+    h.update(str(PT_TABLE_VERSION).encode())
+    return h.hexdigest()
+
+def _elementToDict(elem):
+    return {'tag': elem.tag, 'attrib': dict(elem.attrib), 'children': [_elementToDict(c) for c in elem]}
+
+def _writeElement(f, d, indent):
+    attrs = ''.join(f' {k}={quoteattr(str(v))}' for k, v in d['attrib'].items())
+    if d['children']:
+        f.write(f'{indent}<{d["tag"]}{attrs}>\n')
+        for child in d['children']:
+            _writeElement(f, child, indent + '    ')
+        f.write(f'{indent}</{d["tag"]}>\n')
+    else:
+        f.write(f'{indent}<{d["tag"]}{attrs}/>\n')
+
+# Step 3a - Route and Time Every Line Once
+def _runPTLines2Flows(netFile, stopFile, linesFile, vc, outFile):
+    # The window and period are placeholders, they are replaced when flows are written
+    subprocess.run(['python', os.path.join(SUMO_HOME, 'tools', 'ptlines2flows.py'), '-n', netFile, '-s', stopFile, '-l', linesFile, '-o', outFile, '--types', vc, '--vtype-prefix', vc[0:3],
+                    '-b', str(PLACEHOLDER_BEGIN), '-e', str(PLACEHOLDER_END), '-p', str(PLACEHOLDER_PERIOD), '--use-osm-routes'], check=True)
+
+# Line ref as ptlines2flows builds it
+def _lineRef(line):
+    return line.replace(' ', '_').replace(';', '+').replace('>', '').replace('<', '')
+
+# For every line ref, in file order: does the ptLine come with its own period?
+# (aerialways without one get --period-aerialway, not -p)
+def _ownPeriods(linesFile, vc):
+    own = {}
+    for _, elem in ET.iterparse(linesFile):
+        if elem.tag == 'ptLine':
+            if elem.get('type') == vc:
+                own.setdefault(_lineRef(elem.get('line', '')), []).append(elem.get('period') is not None or elem.get('type') == 'aerialway')
+            elem.clear()
+    return own
+
+def _hasOwnPeriod(own, line):
+    # Flows carry line="ref:k" (the k-th line with that ref) or "ref" for joined lines
+    ref, _, k = line.rpartition(':')
+    if not ref:
+        ref, k = line, '0'
+    flags = own.get(ref, [])
+    return flags[int(k)] if k.isdigit() and int(k) < len(flags) else False
+
+def _routeDuration(d):
+    # 'until' of the last stop: time from the departure to the end of the route
+    untils = [float(c['attrib']['until']) for c in d['children'] if c['tag'] == 'stop' and 'until' in c['attrib']]
+    return untils[-1] if untils else None
+
+def buildPTLineTable(netFile, stopFile, linesFile, vc, cacheDir=PT_CACHE_DIR):
+    key = ptCacheKey(netFile, stopFile, linesFile, vc)
+    cacheFile = os.path.join(cacheDir, key + '.json')
+    if os.path.exists(cacheFile):
+        with open(cacheFile) as f:
+            return json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        outFile = os.path.join(tmpDir, 'ptflows.rou.xml')
+        _runPTLines2Flows(netFile, stopFile, linesFile, vc, outFile)
+        root = ET.parse(outFile).getroot()
+
+    own = _ownPeriods(linesFile, vc)
+    table = {'vTypes': [], 'routes': [], 'flows': []}
+    for elem in root:
+        if elem.tag == 'vType':
+            table['vTypes'].append(_elementToDict(elem))
+        elif elem.tag == 'route':
+            # Stop sequence with dwell and 'until' offsets (stop-to-stop travel times)
+            d = _elementToDict(elem)
+            d['duration'] = _routeDuration(d)
+            d['cycleTime'] = float(d['attrib']['cycleTime']) if 'cycleTime' in d['attrib'] else d['duration']
+            for attr in ROUTE_WINDOW_ATTRS:
+                d['attrib'].pop(attr, None)
+            table['routes'].append(d)
+        elif elem.tag == 'flow':
+            d = _elementToDict(elem)
+            d['beginOffset'] = float(d['attrib']['begin']) - PLACEHOLDER_BEGIN
+            d['period'] = d['attrib']['period'] if _hasOwnPeriod(own, d['attrib'].get('line', '')) else None
+            d['loop'] = 'number' in d['attrib']
+            for attr in FLOW_WINDOW_ATTRS:
+                d['attrib'].pop(attr, None)
+            table['flows'].append(d)
+
+    os.makedirs(cacheDir, exist_ok=True)
+    tmpFile = cacheFile + '.tmp'
+    with open(tmpFile, 'w') as f:
+        json.dump(table, f)
+    os.replace(tmpFile, cacheFile)
+    return table
+
+# Step 3b - Write Flows for a Period / Time Window
+def writePTFlows(table, flowsFile, nMobiles, sTime, eTime):
+    period = (eTime - sTime) / nMobiles
+    duration = eTime - sTime
+    durations = {d['attrib']['id']: d['duration'] for d in table['routes']}
+    loops = {d['attrib']['route'] for d in table['flows'] if d['loop'] and durations.get(d['attrib']['route'])}
+    with open(flowsFile, 'w') as f:
+        f.write('<routes>\n')
+        for d in table['vTypes']:
+            _writeElement(f, d, '    ')
+        for d in table['routes']:
+            attrib = dict(d['attrib'])
+            if attrib['id'] in loops:
+                repeat = math.ceil(duration / d['cycleTime'])
+                if repeat > 1:
+                    attrib.update(repeat=str(repeat), cycleTime=str(d['cycleTime']))
+            _writeElement(f, {'tag': d['tag'], 'attrib': attrib, 'children': d['children']}, '    ')
+        for d in table['flows']:
+            attrib = dict(d['attrib'])
+            flowPeriod = d['period'] if d['period'] is not None else str(period)
+            begin = sTime + d['beginOffset']
+            attrib['begin'] = str(begin)
+            if attrib['route'] in loops:
+                attrib['number'] = str(max(1, int(durations[attrib['route']] / float(flowPeriod))))
+            else:
+                attrib['end'] = str(begin + duration)
+            attrib['period'] = flowPeriod
+            _writeElement(f, {'tag': d['tag'], 'attrib': attrib, 'children': d['children']}, '    ')
+        f.write('</routes>\n')
+
+def generateCachedSchedules(netFile, stopFile, linesFile, flowsFile, nMobiles, vc, sTime, eTime, cacheDir=PT_CACHE_DIR):
+    table = buildPTLineTable(netFile, stopFile, linesFile, vc, cacheDir)
+    writePTFlows(table, flowsFile, nMobiles, sTime, eTime)
@@ -0,0 +1,189 @@
+#!/usr/bin/python
+
+import os
+import subprocess
+from multiprocessing import Pool
+
+import numpy as np
+
+# Seeded in-process replacement for 'netgenerate --rand' / '--rand.grid'.
+# Nodes are laid out on a lattice (jittered for random nets, exact for grid
+# nets), candidate streets are the lattice neighbours (plus diagonals for
+# random nets) and a seeded subset of them is kept subject to connectivity
+# and degree constraints. The result is written as plain .nod.xml/.edg.xml
+# and handed to netconvert.
+
+GRID_LENGTH = 100.0     # Distance between lattice points (m)
+JITTER = 0.35           # Random displacement as a fraction of GRID_LENGTH
+MAX_DEGREE = 4          # Maximum number of streets at a junction
+KEEP_RATIO = 0.6        # Expected fraction of candidate streets that are kept
+
+# Step 1a - Candidate Streets on a Lattice
+def _latticeCandidates(rows, cols, diagonals):
+    idx = np.arange(rows * cols).reshape(rows, cols)
+    pairs = [np.stack([idx[:, :-1].ravel(), idx[:, 1:].ravel()], axis=1),
+             np.stack([idx[:-1, :].ravel(), idx[1:, :].ravel()], axis=1)]
+    if diagonals:
+        pairs.append(np.stack([idx[:-1, :-1].ravel(), idx[1:, 1:].ravel()], axis=1))
+        pairs.append(np.stack([idx[:-1, 1:].ravel(), idx[1:, :-1].ravel()], axis=1))
+    return np.concatenate(pairs)
+
+# Candidate pairs (i, j) whose streets cross without sharing a junction, e.g.
+# the two diagonals of a lattice cell or, with jitter, a diagonal and the side
+# of a neighbouring cell. Returns for every candidate the candidates it crosses.
+def _crossingCandidates(xy, candidates):
+    p, q = xy[candidates[:, 0]], xy[candidates[:, 1]]
+    # Crossing streets have their midpoints closer than the longest street
+    size = float(np.hypot(*(q - p).T).max())
+    keys = np.floor((p + q) / 2 / size).astype(np.int64)
+    buckets = {}
+    for i, key in enumerate(map(tuple, keys.tolist())):
+        buckets.setdefault(key, []).append(i)
+
+    def orient(a, b, c):
+        return np.sign((b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) - (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0]))
+
+    crossing = [[] for _ in range(len(candidates))]
+    for (bx, by), own in buckets.items():
+        near = [j for dx in (-1, 0, 1) for dy in (-1, 0, 1) for j in buckets.get((bx + dx, by + dy), [])]
+        a, b = np.array(own)[:, None], np.array(near)[None, :]
+        shared = ((candidates[a, 0] == candidates[b, 0]) | (candidates[a, 0] == candidates[b, 1]) |
+                  (candidates[a, 1] == candidates[b, 0]) | (candidates[a, 1] == candidates[b, 1]))
+        cross = ((orient(p[a], q[a], p[b]) * orient(p[a], q[a], q[b]) < 0) &
+                 (orient(p[b], q[b], p[a]) * orient(p[b], q[b], q[a]) < 0) & ~shared)
+        for i, j in zip(*np.nonzero(cross)):
+            crossing[own[i]].append(near[j])
+    return crossing
+
+# Step 1b - Connected Components (vectorized label propagation)
+def connectedComponents(numNodes, edges):
+    labels = np.arange(numNodes)
+    if len(edges) == 0:
+        return labels
+    u, v = edges[:, 0], edges[:, 1]
+    while True:
+        m = np.minimum(labels[u], labels[v])
+        new = labels.copy()
+        np.minimum.at(new, u, m)
+        np.minimum.at(new, v, m)
+        # Pointer jumping so that long chains collapse quickly
+        new = new[new]
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+# Step 1c - Seeded Selection of Streets
+# crossing: optional list of the candidates each candidate crosses, only one of them is chosen
+def _selectEdges(numNodes, candidates, numEdges, maxDegree, rng, crossing=None):
+    order = rng.permutation(len(candidates))
+    candidates = candidates[order]
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order))
+    blocked = np.zeros(len(candidates), dtype=bool)
+
+    def choose(i):
+        if crossing is not None:
+            blocked[position[crossing[order[i]]]] = True
+
+    parent = list(range(numNodes))
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    degree = np.zeros(numNodes, dtype=np.int64)
+    chosen = np.zeros(len(candidates), dtype=bool)
+    count = 0
+
+    # First pass builds a spanning forest so the net stays connected
+    for i, (a, b) in enumerate(candidates.tolist()):
+        if count >= numEdges:
+            break
+        if blocked[i] or degree[a] >= maxDegree or degree[b] >= maxDegree:
+            continue
+        ra, rb = find(a), find(b)
+        if ra == rb:
+            continue
+        parent[ra] = rb
+        choose(i)
+        degree[a] += 1
+        degree[b] += 1
+        chosen[i] = True
+        count += 1
+
+    # Second pass adds cycles until the requested number of streets is reached
+    for i, (a, b) in enumerate(candidates.tolist()):
+        if count >= numEdges:
+            break
+        if chosen[i] or blocked[i] or degree[a] >= maxDegree or degree[b] >= maxDegree:
+            continue
+        choose(i)
+        degree[a] += 1
+        degree[b] += 1
+        chosen[i] = True
+        count += 1
+
+    return candidates[chosen]
+
+# Step 1 - Random Node/Edge Arrays
+def generateRandomNodesEdges(numEdges, seed, grid=False, maxDegree=MAX_DEGREE):
+    rng = np.random.default_rng(seed)
+    diagonals = not grid
+    # Streets per lattice point: 2 (h+v) or 4 (with diagonals), capped by the degree limit
+    perNode = min(4 if diagonals else 2, maxDegree / 2)
+    side = max(2, int(np.ceil(np.sqrt(numEdges / (perNode * KEEP_RATIO)))))
+    rows = cols = side
+
+    yy, xx = np.mgrid[0:rows, 0:cols]
+    xy = np.stack([xx.ravel(), yy.ravel()], axis=1).astype(float) * GRID_LENGTH
+    if not grid:
+        xy += rng.uniform(-JITTER, JITTER, size=xy.shape) * GRID_LENGTH
+
+    candidates = _latticeCandidates(rows, cols, diagonals)
+    # Streets never cross without a junction, like in 'netgenerate --rand' (only diagonals can cross)
+    crossing = _crossingCandidates(xy, candidates) if diagonals else None
+    edges = _selectEdges(rows * cols, candidates, numEdges, maxDegree, rng, crossing)
+
+    # Keep only the largest connected component and drop isolated nodes
+    labels = connectedComponents(rows * cols, edges)
+    edgeLabels = labels[edges[:, 0]]
+    largest = np.bincount(edgeLabels).argmax()
+    edges = edges[edgeLabels == largest]
+    used = np.unique(edges)
+    remap = np.full(rows * cols, -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    return xy[used], remap[edges]
+
+# Step 2 - Write Plain XML Files for netconvert
+def writePlainXML(xy, edges, nodFile, edgFile, junctionType='traffic_light'):
+    with open(nodFile, 'w') as f:
+        f.write('<nodes>\n')
+        f.writelines(f'    <node id="n{i}" x="{x:.2f}" y="{y:.2f}" type="{junctionType}"/>\n' for i, (x, y) in enumerate(xy.tolist()))
+        f.write('</nodes>\n')
+    with open(edgFile, 'w') as f:
+        f.write('<edges>\n')
+        for i, (a, b) in enumerate(edges.tolist()):
+            # Two-way streets like netgenerate produces
+            f.write(f'    <edge id="e{i}" from="n{a}" to="n{b}" numLanes="1" speed="13.89"/>\n')
+            f.write(f'    <edge id="-e{i}" from="n{b}" to="n{a}" numLanes="1" speed="13.89"/>\n')
+        f.write('</edges>\n')
+
+# Step 3 - Convert Plain XML to SUMO Network
+def convertPlainToSUMONet(nodFile, edgFile, netFile):
+    subprocess.run(['netconvert', '--node-files', nodFile, '--edge-files', edgFile, '-o', netFile], check=True)
+
+def generateSeededRandomNet(outFile, numEdges, seed, grid=False):
+    prefix = outFile[:-len('.net.xml')] if outFile.endswith('.net.xml') else outFile
+    nodFile = prefix + '.nod.xml'
+    edgFile = prefix + '.edg.xml'
+    xy, edges = generateRandomNodesEdges(numEdges, seed, grid)
+    writePlainXML(xy, edges, nodFile, edgFile)
+    convertPlainToSUMONet(nodFile, edgFile, outFile)
+    return outFile
+
+# Generate one net per (outFile, seed) in parallel
+def generateRandomNets(outFiles, numEdges, seeds, grid=False, processes=None):
+    jobs = [(outFile, numEdges, seed, grid) for outFile, seed in zip(outFiles, seeds)]
+    with Pool(processes or os.cpu_count()) as pool:
+        return pool.starmap(generateSeededRandomNet, jobs)
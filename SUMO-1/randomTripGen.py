@@ -2,16 +2,14 @@
 
 import subprocess
 import os
+from randomNetGen import generateRandomNets
+from traceStream import convertTraceWithAnalytics
+from traceShard import shardByTime
 
 # Set SUMO_HOME to the correct path in Windows
 SUMO_HOME = r"C:\Program Files (x86)\Eclipse\Sumo"
 
-# Step 1 - Network Generation
-def generateRandomSUMONet(outFile, numEdges):
-    subprocess.run(['netgenerate.exe', '--rand', '-o', outFile, '--rand.iterations=' + str(numEdges), '-j', 'traffic_light', '--random'], shell=True)
-
-def generateRandomGridSUMONet(outFile, numEdges, randomGrid):
-    subprocess.run(['netgenerate.exe', '--rand', '-o', outFile, '--rand.iterations=' + str(numEdges), '-j', 'traffic_light', '--random', '--rand.grid'], shell=True)
+# Step 1 - Network Generation: randomNetGen.generateRandomNets (seeded, in parallel, see __main__)
 
 # Step 2 - Random Trips Generation
 def generateRandomTrips(netFile, outFile, vClass, nMobiles, sTime, eTime):
@@ -39,31 +37,36 @@ def generateConfigFile(netFile, routeFile, outFile):
 def runSimulation(configFile, traceFile):
     subprocess.run(['sumo.exe', '-c', configFile, '--fcd-output', traceFile], shell=True)
 
-# Step 6 - Convert the Trace to NS2 Format
+# Step 6 - Convert the Trace to NS2 Format (and write the trace statistics summary on the same parse)
 def convertTrace(traceFile, outFile):
-    subprocess.run(['python', os.path.join(SUMO_HOME, 'tools', 'traceExporter.py'), '--fcd-input', traceFile, '--ns2mobility-output', outFile], shell=True)
+    convertTraceWithAnalytics(traceFile, outFile)
 
 if __name__ == '__main__':
 
     iterations = 30
     numEdges = 5000
+    seeds = list(range(iterations))
+    randomGrid = False
 
     vClasses = ["passenger", "bicycle"]
     nMobiles = 25
     sTime = 0
     eTime = 12000
+    shardWindow = 1200  # Length of the time shards of the NS2 trace (s)
 
     folder = "C:\\Users\\MONSTER\\my_data2\\random\\"
     #folder = "my_data2\\random_grid\\"
 
     # Create the output folder if it doesn't exist
     os.makedirs(folder, exist_ok=True)
+
+    # Generate all (seeded) net files in parallel
+    netFiles = [os.path.join(folder, f"{i}_randomNet_{numEdges}.net.xml") for i in range(iterations)]
+    generateRandomNets(netFiles, numEdges, seeds, randomGrid)
     
     for i in range(iterations):
         fname = os.path.join(folder, f"{i}_randomNet_{numEdges}")
-        # Generate net file
         netFile = fname + ".net.xml"
-        generateRandomSUMONet(netFile, numEdges)
 
         for vc in vClasses:
             # Generate trip file
@@ -85,3 +88,6 @@ if __name__ == '__main__':
             # Convert the trace file to NS2 format
             ns2File = fname + f"_{vc}_trace.tcl"
             convertTrace(traceFile, ns2File)
+
+            # Split the NS2 trace into independently loadable time shards
+            shardByTime(ns2File, shardWindow)
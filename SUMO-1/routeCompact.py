@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+# Post-routing stage: vehicles that drive the same path share one named
+# <route> instead of each carrying an inline <route edges="..."/>. The route
+# definition is written right before the first vehicle that uses it, so the
+# file is still sorted by departure and can be converted in one streaming
+# pass. Inline routes with stops or other children are left as they are.
+
+ROUTE_PREFIX = 'r_'
+XSI = '{http://www.w3.org/2001/XMLSchema-instance}'
+
+def _attrs(attrib):
+    return ''.join(f' {k}={quoteattr(v)}' for k, v in attrib.items())
+
+# Step 1 - Intern Identical Edge Sequences
+def compactRoutes(routeFile, outFile):
+    routes = {}
+    vehicles = shared = 0
+    tmpFile = outFile + '.tmp'
+    # The source is read through its own handle, which is closed before the
+    # output replaces it (outFile may be routeFile; Windows cannot replace an open file)
+    try:
+        with open(routeFile, 'rb') as src, open(tmpFile, 'w', encoding='utf-8') as f:
+            context = ET.iterparse(src, events=('start', 'end'))
+            _, root = next(context)
+            # Keep the schema reference (ElementTree expands the xsi prefix)
+            rootAttrib = {k.replace(XSI, 'xsi:'): v for k, v in root.attrib.items()}
+            if any(k.startswith('xsi:') for k in rootAttrib):
+                rootAttrib = {'xmlns:xsi': XSI[1:-1], **rootAttrib}
+            depth = 0
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n\n')
+            f.write(f'<routes{_attrs(rootAttrib)}>\n')
+            for event, elem in context:
+                if event == 'start':
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth != 0:
+                    # Nested element (handled with its vehicle) or the end of <routes>
+                    continue
+                if elem.tag == 'vehicle':
+                    vehicles += 1
+                    children = list(elem)
+                    inline = [c for c in children if c.tag == 'route']
+                    if len(inline) == 1 and len(inline[0]) == 0 and 'route' not in elem.attrib:
+                        route = inline[0]
+                        key = tuple(route.attrib.items())
+                        routeId = routes.get(key)
+                        if routeId is None:
+                            routeId = routes[key] = f'{ROUTE_PREFIX}{len(routes)}'
+                            f.write(f'    <route id="{routeId}"{_attrs(route.attrib)}/>\n')
+                        else:
+                            shared += 1
+                        rest = [c for c in children if c is not route]
+                        attrib = dict(elem.attrib)
+                        attrib['route'] = routeId
+                        if rest:
+                            f.write(f'    <vehicle{_attrs(attrib)}>\n')
+                            for c in rest:
+                                f.write('        ' + ET.tostring(c, encoding='unicode').strip() + '\n')
+                            f.write('    </vehicle>\n')
+                        else:
+                            f.write(f'    <vehicle{_attrs(attrib)}/>\n')
+                    else:
+                        f.write('    ' + ET.tostring(elem, encoding='unicode').strip() + '\n')
+                else:
+                    f.write('    ' + ET.tostring(elem, encoding='unicode').strip() + '\n')
+                root.clear()
+            f.write('</routes>\n')
+    except BaseException:
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+        raise
+    os.replace(tmpFile, outFile)
+    return {'vehicles': vehicles, 'routes': len(routes), 'sharedRoutes': shared}
+
+def altFileFor(routeFile):
+    return routeFile[:-len('.xml')] + '.alt.xml'
+
+# Compact the duarouter output in place and drop the .alt.xml copy unless it is needed
+def compactRouteOutput(routeFile, keepAlternatives=False):
+    stats = compactRoutes(routeFile, routeFile)
+    altFile = altFileFor(routeFile)
+    if not keepAlternatives and os.path.exists(altFile):
+        os.remove(altFile)
+    return stats
+
+# Step 2 - Report Size and sumo Load Time
+def sumoLoadTime(netFile, routeFile):
+    # --route-steps 0 makes sumo load all routes up front instead of incrementally
+    start = time.perf_counter()
+    subprocess.run(['sumo', '-n', netFile, '-r', routeFile, '--route-steps', '0', '--end', '0', '--no-step-log', '--no-warnings'],
+                   check=True, capture_output=True)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'my_data2', 'osm')
+    haveSumo = shutil.which('sumo') is not None
+
+    totals = [0, 0, 0]
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith('_routes.xml'):
+                continue
+            routeFile = os.path.join(folder, name)
+            altFile = altFileFor(routeFile)
+            compactFile = os.path.join(tmpDir, name)
+            stats = compactRoutes(routeFile, compactFile)
+
+            before = os.path.getsize(routeFile)
+            alt = os.path.getsize(altFile) if os.path.exists(altFile) else 0
+            after = os.path.getsize(compactFile)
+            totals[0] += before
+            totals[1] += alt
+            totals[2] += after
+            line = (f"{name}: {stats['vehicles']} vehicles, {stats['routes']} distinct routes, "
+                    f"{before + alt} -> {after} bytes (routes {before}, alt {alt})")
+
+            netFile = os.path.join(folder, name[:-len('_routes.xml')] + '.net.xml')
+            if haveSumo and os.path.exists(netFile):
+                line += f", sumo load {sumoLoadTime(netFile, routeFile):.2f}s -> {sumoLoadTime(netFile, compactFile):.2f}s"
+            print(line)
+    print(f"Total: {totals[0] + totals[1]} -> {totals[2]} bytes ({100.0 * (1 - totals[2] / (totals[0] + totals[1])):.1f}% smaller)")
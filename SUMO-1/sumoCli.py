@@ -0,0 +1,105 @@
+#!/usr/bin/python
+
+import argparse
+import importlib
+import sys
+
+# Single entry point for the pipeline steps in bursa.py. Nothing heavy is
+# imported at start-up: each subcommand imports the step it runs, and only
+# 'download' loads osmnx (geopandas/shapely/networkx), see test_sumoCli.py.
+#
+#   python sumoCli.py download "Gemlik, Bursa, Türkiye" --out-dir my_data2/osm --osm-file my_data2/osm/Gemlik.osm.xml
+#   python sumoCli.py build-net --osm-file Gemlik.osm.xml --net-file Gemlik.net.xml
+#   python sumoCli.py trips --net-file Gemlik.net.xml --out Gemlik_trips.xml
+#   python sumoCli.py route --net-file Gemlik.net.xml --trips Gemlik_trips.xml --out Gemlik_routes.xml
+#   python sumoCli.py simulate --net-file Gemlik.net.xml --routes Gemlik_routes.xml --config Gemlik_config.sumocfg --trace Gemlik_trace.xml
+#   python sumoCli.py export --trace Gemlik_trace.xml --ns2 Gemlik_trace.ns2 --output omnet=Gemlik_omnet.xml
+
+# Module and step function behind each subcommand
+STAGES = {
+    'download': ('bursa', 'getMapFromOSM'),
+    'build-net': ('bursa', 'convertOSMToSUMONet'),
+    'trips': ('bursa', 'generateRandomTrips'),
+    'route': ('bursa', 'generateRoutes'),
+    'simulate': ('bursa', 'runSimulation'),
+    'export': ('bursa', 'convertTrace'),
+}
+
+def loadStage(command):
+    module, name = STAGES[command]
+    return getattr(importlib.import_module(module), name)
+
+def cmdDownload(args):
+    loadStage('download')(args.place, args.dist, args.out_dir, args.osm_file)
+
+def cmdBuildNet(args):
+    loadStage('build-net')(args.osm_file, args.net_file, tuple(args.tiles) if args.tiles else None)
+
+def cmdTrips(args):
+    loadStage('trips')(args.net_file, args.out, args.vclass, args.mobiles, args.begin, args.end)
+
+def cmdRoute(args):
+    loadStage('route')(args.net_file, args.trips, args.out)
+
+def cmdSimulate(args):
+    from bursa import generateConfigFile
+    generateConfigFile(args.net_file, args.routes, args.config)
+    loadStage('simulate')(args.config, args.trace)
+
+def cmdExport(args):
+    extraOutputs = dict(o.split('=', 1) for o in args.output)
+    loadStage('export')(args.trace, args.ns2, extraOutputs)
+
+def buildParser():
+    parser = argparse.ArgumentParser(description='SUMO scenario pipeline')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('download', help='download the OSM data around a place')
+    p.add_argument('place')
+    p.add_argument('--dist', type=int, default=1000, help='half size of the bbox (m)')
+    p.add_argument('--out-dir', required=True)
+    p.add_argument('--osm-file', required=True)
+    p.set_defaults(func=cmdDownload)
+
+    p = sub.add_parser('build-net', help='convert an OSM file to a SUMO network')
+    p.add_argument('--osm-file', required=True)
+    p.add_argument('--net-file', required=True)
+    p.add_argument('--tiles', type=int, nargs=2, metavar=('NX', 'NY'), help='tiled parallel build on an NX x NY grid')
+    p.set_defaults(func=cmdBuildNet)
+
+    p = sub.add_parser('trips', help='generate random trips')
+    p.add_argument('--net-file', required=True)
+    p.add_argument('--out', required=True)
+    p.add_argument('--vclass', default='passenger')
+    p.add_argument('--mobiles', type=int, default=100)
+    p.add_argument('--begin', type=float, default=0)
+    p.add_argument('--end', type=float, default=3600)
+    p.set_defaults(func=cmdTrips)
+
+    p = sub.add_parser('route', help='route trips with duarouter')
+    p.add_argument('--net-file', required=True)
+    p.add_argument('--trips', required=True)
+    p.add_argument('--out', required=True)
+    p.set_defaults(func=cmdRoute)
+
+    p = sub.add_parser('simulate', help='write the config and run sumo with fcd output')
+    p.add_argument('--net-file', required=True)
+    p.add_argument('--routes', required=True)
+    p.add_argument('--config', required=True)
+    p.add_argument('--trace', required=True)
+    p.set_defaults(func=cmdSimulate)
+
+    p = sub.add_parser('export', help='convert the fcd trace to ns2 (and other formats)')
+    p.add_argument('--trace', required=True)
+    p.add_argument('--ns2', required=True)
+    p.add_argument('--output', action='append', default=[], metavar='FORMAT=FILE',
+                   help='additional output: ns2config, ns2activity, omnet, one or bonnmotion')
+    p.set_defaults(func=cmdExport)
+    return parser
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    return args.func(args) or 0
+
+if __name__ == '__main__':
+    sys.exit(main())
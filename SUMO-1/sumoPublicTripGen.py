@@ -1,13 +1,14 @@
 #!/usr/bin/python
 
-import osmnx as ox
 import subprocess
 import os
+from ptSchedules import generateCachedSchedules
 
 SUMO_HOME = r"C:\Program Files (x86)\Eclipse\Sumo"  # Adjust this to your SUMO installation path
 
 # Step 1 - Download Map from OSM
 def getMapFromOSM(place, dist, outDir, outFile):
+    import osmnx as ox
     # Geocode
     lat, lng = ox.geocode(place)
     p = lat, lng
@@ -31,8 +32,9 @@ def convertOSMtoSUMONet(osmFile, netFile, stopsFile, linesFile):
     subprocess.run(['netconvert', '--type-files', typeFile1 + ',' + typeFile2, '--osm-files', osmFile, '-o', netFile, '--osm.stop-output.length', '20', '--ptstop-output', stopsFile, '--ptline-output', linesFile, '--geometry.remove', '--roundabouts.guess', '--ramps.guess', '--junctions.join', '--tls.guess-signals', '--tls.discard-simple', '--tls.join'])
 
 # Step 3 - Find Travel Times & Create Public Transport Schedules
+# Lines are routed and timed once per (net, stops, lines, vc) and cached, only the flows are rewritten
 def generateSchedules(netFile, stopFile, linesFile, flowsFile, nMobiles, vc, sTime, eTime):
-    subprocess.run(['python', os.path.join(SUMO_HOME, 'tools', 'ptlines2flows.py'), '-n', netFile, '-s', stopFile, '-l', linesFile, '-o', flowsFile, '--types', vc, '--vtype-prefix', vc[0:3], '-b', str(sTime), '-e', str(eTime), '-p', str((eTime - sTime) / nMobiles), '--use-osm-routes'])
+    generateCachedSchedules(netFile, stopFile, linesFile, flowsFile, nMobiles, vc, sTime, eTime)
 
 # Step 4 - Random Trips Generation
 def generateRandomTrips(netFile, outFile, nMobiles, vc, sTime, eTime):
@@ -57,7 +59,7 @@ def generateConfigFile(netFile, routeFile, flowFile, outFile):
 
 # Step 7 - Run the Simulation
 def runSimulation(netFile, routeFile, flowFile, stopFile, traceFile):
-    subprocess.run(['sumo', '-n', netFile, '-r', routeFile, '-a', stopFile, '--fcd-output', traceFile]) 
+    subprocess.run(['sumo', '-n', netFile, '-r', routeFile + ',' + flowFile, '-a', stopFile, '--fcd-output', traceFile])
 
 # Step 8 - Convert the Trace to NS2 Format
 def convertTrace(traceFile, outFile):
@@ -75,7 +77,7 @@ if __name__ == '__main__':
     eTime = 12000
     vc = 'bus'
     
-    folder =  "C:\Users\MONSTER\my_data2\osm-pt" 
+    folder =  r"C:\Users\MONSTER\my_data2\osm-pt" 
  
     # Create the directory if it does not exist
     os.makedirs(folder, exist_ok=True)
@@ -1,15 +1,31 @@
 #!/usr/bin/python
 
-import osmnx as ox
 import subprocess
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from procGovernor import MemoryGovernor
 
 # Set SUMO_HOME to the correct path in Windows
 SUMO_HOME = r"C:\Program Files (x86)\Eclipse\Sumo"
 
+# netconvert options of the network build (passed to osmBuild.py, or to every tile in a tiled build)
+NETCONVERT_OPTIONS = ['--tls.ignore-internal-junction-jam']
+
+# Child processes are admitted by the memory governor when one is set up (see __main__)
+governor = None
+
+def runProcess(cmd, kind, inputFiles, **kwargs):
+    if governor is None:
+        return subprocess.run(cmd, **kwargs)
+    # Job size for the peak RSS prediction: total size of the input files
+    size = sum(os.path.getsize(f) for f in inputFiles if os.path.exists(f))
+    return governor.run(cmd, kind, size, **kwargs)
+
 # Step 1 - Download Map from OSM
 def getMapFromOSM(place, dist, outDir, outFile):
+    # Lazy import, osmnx is only needed for the download step
+    import osmnx as ox
     try:
         # Geocode
         p = ox.geocode(place)
@@ -44,38 +60,40 @@ def getMapFromOSM(place, dist, outDir, outFile):
         print(f'Warning: {original_file} not found. Please check the download process.')
 
 # Step 2 - Convert OSM Map to SUMO Network
-def generateSUMONetFromOSM(osmFile, outDir, iteration):
+# tiles=(nx, ny): split the OSM file into nx x ny tiles and convert them in parallel (see tiledNetBuild.py)
+def generateSUMONetFromOSM(osmFile, outDir, iteration, tiles=None):
     print(f"Generating SUMO network from {osmFile}...")
     try:
+        # Her iterasyon kendi önekini kullanır, böylece paralel çalışan dönüşümler aynı dosyaya yazmaz
+        prefix = f'{iteration}_osm_bbox_{5000}_osm'
+        if tiles:
+            from tiledNetBuild import buildTiledNet
+            new_net_file = os.path.join(outDir, f'{prefix}.net.xml')
+            buildTiledNet(osmFile, new_net_file, *tiles, governor=governor, netconvertOptions=NETCONVERT_OPTIONS)
+            print(f"Generated network file: {new_net_file}")
+            return
+
         osm_build_script = os.path.join(SUMO_HOME, "tools", "osmBuild.py")
-        command = f'python "{osm_build_script}" --osm-file "{osmFile}" --netconvert-options=--tls.ignore-internal-junction-jam --output-directory "{outDir.rstrip("\\")}"'
+        outDirArg = outDir.rstrip("\\")
+        command = f'python "{osm_build_script}" --osm-file "{osmFile}" --prefix {prefix} --netconvert-options={",".join(NETCONVERT_OPTIONS)} --output-directory "{outDirArg}"'
 
         print(f"Running command: {command}")  # Debugging output
 
-        result = subprocess.run(command, check=True, shell=True, capture_output=True)
+        result = runProcess(command, 'netconvert', [osmFile], check=True, shell=True, capture_output=True)
 
         print("Standard Output:", result.stdout.decode())
         print("Standard Error:", result.stderr.decode())
 
-        # Oluşan dosyanın adını belirle
-        original_net_file = 'osm.net.xml'  # OSM dosyasından oluşturulan ağ dosyasının varsayılan adı
-        new_net_file = os.path.join(outDir, f'{iteration}_osm_bbox_{5000}_osm.net.xml')  # Yeni dosya adı
-
-        # Dosyanın varlığını kontrol et ve yeniden adlandır
-        if os.path.exists(os.path.join(outDir, original_net_file)):
-            shutil.move(os.path.join(outDir, original_net_file), new_net_file)
+        # Önek sayesinde dosyalar doğrudan son adlarıyla oluşur
+        new_net_file = os.path.join(outDir, f'{prefix}.net.xml')
+        if os.path.exists(new_net_file):
             print(f"Generated network file: {new_net_file}")
 
-        # Burada oluşan 'osm.netccfg' dosyasının adını da değiştiriyoruz
-        original_cfg_file = 'osm.netccfg'  # OSM ağ yapılandırma dosyasının varsayılan adı
-        new_cfg_file = os.path.join(outDir, f'{iteration}_osm_bbox_{5000}_osm.netccfg')  # Yeni dosya adı
-
-        # CFG dosyasının varlığını kontrol et ve yeniden adlandır
-        if os.path.exists(os.path.join(outDir, original_cfg_file)):
-            shutil.move(os.path.join(outDir, original_cfg_file), new_cfg_file)
+        new_cfg_file = os.path.join(outDir, f'{prefix}.netccfg')
+        if os.path.exists(new_cfg_file):
             print(f"Generated config file: {new_cfg_file}")
         else:
-            print(f"Warning: Config file not found at expected location: {original_cfg_file}")
+            print(f"Warning: Config file not found at expected location: {new_cfg_file}")
 
     except subprocess.CalledProcessError as e:
         error_message = e.stderr.decode() if e.stderr else "No error message provided."
@@ -88,7 +106,7 @@ def extractPolygonsFromOSM(osmFile, netFile, typeFile, outFile):
         return
 
     try:
-        subprocess.run(['polyconvert', '--net-file', netFile, '--osm-files', osmFile, '--type-file', typeFile, '-o', outFile], check=True)
+        runProcess(['polyconvert', '--net-file', netFile, '--osm-files', osmFile, '--type-file', typeFile, '-o', outFile], 'polyconvert', [osmFile, netFile], check=True)
     except subprocess.CalledProcessError as e:
         error_message = e.stderr.decode() if e.stderr else "No error message provided."
         print(f"Error extracting polygons from {osmFile}: {error_message}")
@@ -96,7 +114,7 @@ def extractPolygonsFromOSM(osmFile, netFile, typeFile, outFile):
 # Step 4 - Random Trips Generation
 def generateRandomTrips(netFile, outFile, vClass, nMobiles, sTime, eTime):
     try:
-        subprocess.run(['python', os.path.join(SUMO_HOME, 'tools', 'randomTrips.py'), '-n', netFile, '-b', str(sTime), '-e', str(eTime), '-o', outFile, '-p', str((eTime - sTime) / nMobiles), '--vehicle-class', vClass, '--random', '--random-depart', '--validate'], check=True)
+        runProcess(['python', os.path.join(SUMO_HOME, 'tools', 'randomTrips.py'), '-n', netFile, '-b', str(sTime), '-e', str(eTime), '-o', outFile, '-p', str((eTime - sTime) / nMobiles), '--vehicle-class', vClass, '--random', '--random-depart', '--validate'], 'randomTrips', [netFile], check=True)
     except subprocess.CalledProcessError as e:
         error_message = e.stderr.decode() if e.stderr else "No error message provided."
         print(f"Error generating random trips: {error_message}")
@@ -104,7 +122,7 @@ def generateRandomTrips(netFile, outFile, vClass, nMobiles, sTime, eTime):
 # Step 5 - Routing
 def generateRoutes(netFile, tripFile, outFile):
     try:
-        subprocess.run(['duarouter', '--net-file', netFile, '--route-files', tripFile, '--output-file', outFile], check=True)
+        runProcess(['duarouter', '--net-file', netFile, '--route-files', tripFile, '--output-file', outFile], 'duarouter', [netFile, tripFile], check=True)
     except subprocess.CalledProcessError as e:
         error_message = e.stderr.decode() if e.stderr else "No error message provided."
         print(f"Error generating routes for {tripFile}: {error_message}")
@@ -128,9 +146,9 @@ def generateConfigFile(netFile, routeFile, polyFile, outFile):
         print(f"Error writing config file {outFile}: {e}")
 
 # Step 7 - Run the Simulation
-def runSimulation(configFile, traceFile):
+def runSimulation(configFile, traceFile, inputFiles=()):
     try:
-        subprocess.run(['sumo', '-c', configFile, '--fcd-output', traceFile], check=True)
+        runProcess(['sumo', '-c', configFile, '--fcd-output', traceFile], 'sumo', inputFiles, check=True)
     except subprocess.CalledProcessError as e:
         error_message = e.stderr.decode() if e.stderr else "No error message provided."
         print(f"Error running SUMO simulation: {error_message}")
@@ -138,7 +156,7 @@ def runSimulation(configFile, traceFile):
 # Step 8 - Convert the Trace to NS2 Format
 def convertTrace(traceFile, outFile):
     try:
-        subprocess.run(['python', os.path.join(SUMO_HOME, 'tools', 'traceExporter.py'), '--fcd-input', traceFile, '--ns2mobility-output', outFile], check=True)
+        runProcess(['python', os.path.join(SUMO_HOME, 'tools', 'traceExporter.py'), '--fcd-input', traceFile, '--ns2mobility-output', outFile], 'traceExporter', [traceFile], check=True)
     except subprocess.CalledProcessError as e:
         error_message = e.stderr.decode() if e.stderr else "No error message provided."
         print(f"Error converting trace file {traceFile} to NS2 format: {error_message}")
@@ -163,10 +181,24 @@ if __name__ == '__main__':
     
     folder = "C:\\Users\\MONSTER\\my_data2\\osm\\"
 
+    # Memory budget for the SUMO child processes (bytes), None: 80% of the physical memory
+    memoryBudget = None
+    governor = MemoryGovernor(memoryBudget)
+
+    # Tiled network build for large boxes, e.g. (2, 2); None: one netconvert run per place
+    tiles = None
+
     # Create the output folder if it doesn't exist
     os.makedirs(folder, exist_ok=True)
-    
+
+    # Download OSM files (sequentially, osmGet.py always writes osm_bbox.osm.xml)
     for i in range(iterations):
+        osmFile = os.path.join(folder, f"{i}_osm_bbox_{dist}.osm.xml")
+        print(f"Downloading OSM file: {osmFile}")
+        getMapFromOSM(places[i], dist, folder, f"{i}_osm_bbox_{dist}.osm.xml")
+
+    # The remaining steps run in parallel, the governor decides how many child processes fit into memory
+    def processPlace(i):
         fname = os.path.join(folder, f"{i}_osm_bbox_{dist}")
         osmFile = fname + ".osm.xml"
         netFile = os.path.join(folder, f'{i}_osm_bbox_{dist}_osm.net.xml')  # Güncellenmiş netFile yolu
@@ -176,22 +208,18 @@ if __name__ == '__main__':
         print(osmFile)
         print(netFile)
 
-        # Download OSM file
-        print(f"Downloading OSM file: {osmFile}")
-        getMapFromOSM(places[i], dist, folder, f"{i}_osm_bbox_{dist}.osm.xml")
-
         # Check if the OSM file was downloaded successfully
         if not os.path.exists(osmFile):
             print(f"OSM file does not exist: {osmFile}")
-            continue  # Eğer dosya yoksa, döngünün sonraki iterasyonuna geç
+            return  # Eğer dosya yoksa, bu iterasyonu atla
 
         # Generate net file
-        generateSUMONetFromOSM(osmFile, folder, i)  # Buraya iterasyon sayısını ekledik
+        generateSUMONetFromOSM(osmFile, folder, i, tiles)  # Buraya iterasyon sayısını ekledik
 
         # Check if the net file was generated successfully
         if not os.path.exists(netFile):
             print(f"Network file does not exist: {netFile}")
-            continue  # Eğer dosya yoksa, döngünün sonraki iterasyonuna geç
+            return  # Eğer dosya yoksa, bu iterasyonu atla
 
         # Extract polygons from the net file
         generateRandomTrips(netFile, polyFile, vClasses[i % len(vClasses)], nMobiles, sTime, eTime)
@@ -203,8 +231,11 @@ if __name__ == '__main__':
 
         # Run the simulation
         traceFile = os.path.join(folder, f"{i}_osm_bbox_{dist}.fcd.xml")
-        runSimulation(configFile, traceFile)
+        runSimulation(configFile, traceFile, [netFile, polyFile])
 
         # Convert trace to NS2 format
         ns2File = os.path.join(folder, f"{i}_osm_bbox_{dist}.ns2mobility")
         convertTrace(traceFile, ns2File)
+
+    with ThreadPoolExecutor(iterations) as executor:
+        list(executor.map(processPlace, range(iterations)))
@@ -1,7 +1,6 @@
 #!/usr/bin/python
 
 import os
-import osmnx as ox
 import subprocess
 import shutil
 
@@ -9,6 +8,8 @@ SUMO_HOME = r"C:\Program Files (x86)\Eclipse\Sumo"  # Update this path to your S
 
 # Step 1 - Download Map from OSM
 def get_map_from_osm(place, dist, out_dir, out_file):
+    # Imported here so that the other steps do not load geopandas/shapely
+    import osmnx as ox
     print(f"Downloading map for place '{place}'...")
     # Geocode
     try:
@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import sumoCli
+
+# Every subcommand except 'download' must start without importing osmnx.
+# Each stage is loaded in a fresh interpreter, so earlier imports do not count.
+@pytest.mark.parametrize('command', [c for c in sumoCli.STAGES if c != 'download'])
+def test_stage_does_not_import_osmnx(command):
+    code = f"import sys, sumoCli; sumoCli.loadStage({command!r}); print('osmnx' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['False']
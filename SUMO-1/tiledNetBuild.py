@@ -0,0 +1,343 @@
+#!/usr/bin/python
+
+import os
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from procGovernor import MemoryGovernor
+
+# Tiled network build for large OSM extracts (e.g. dist=5000 city boxes).
+#  1. The OSM file is split into an nx x ny grid of tiles. Every way belongs
+#     to the tile of its centroid; a tile also contains all ways that share a
+#     node with its own ways (the overlap), so junctions and the '#k' splits
+#     of its own ways come out the same as in a build of the whole file.
+#  2. The tiles are converted in parallel (through the memory governor) to
+#     plain XML with a common projection and absolute coordinates.
+#  3. Only the edges of each tile's own ways are kept. Boundary nodes shared
+#     by several tiles are de-duplicated by id, and netconvert builds the
+#     final .net.xml from the stitched plain files, with the same options as
+#     the tiles (so e.g. the TLS options end up in the net as well).
+# A tile does not see the ways next to its neighbour ways, so a neighbour way
+# may be split differently than in its owner tile and the same id (W#1) can
+# name another segment. Connections into ways of other tiles are therefore
+# resolved against the stitched edges by the node where they start.
+# Options whose heuristics reach further than the overlap (--ramps.guess,
+# --junctions.join) can still give small differences at the tile borders.
+
+# Ways netconvert turns into edges. Only these are owned by a tile, but all ways
+# stay in the overlap: netconvert also splits a road where e.g. a ditch crosses it.
+NETWORK_KEYS = ('highway', 'railway', 'aeroway', 'route')
+
+# Rings of neighbouring ways around the own ways of a tile. With one ring the
+# neighbour ways are cut off, and netconvert may guess other turnarounds at
+# the junctions of the own ways than in a build of the whole file.
+OVERLAP_RINGS = 2
+
+# Extra netconvert options the validation also builds with (TLS guessing and joining)
+VALIDATION_OPTIONS = ['--tls.guess-signals', '--tls.join', '--tls.ignore-internal-junction-jam']
+
+def _centroidTiles(lat, lon, bounds, nx, ny):
+    south, west, north, east = bounds
+    tx = np.clip(((lon - west) / ((east - west) or 1.0) * nx).astype(int), 0, nx - 1)
+    ty = np.clip(((lat - south) / ((north - south) or 1.0) * ny).astype(int), 0, ny - 1)
+    return ty * nx + tx
+
+# Step 1a - Way Ownership and Tile Membership
+def planTiles(osmFile, nx, ny):
+    nodeIds, nodeLat, nodeLon = [], [], []
+    ways = {}
+    network = set()
+    for _, elem in ET.iterparse(osmFile):
+        if elem.tag == 'node':
+            nodeIds.append(int(elem.get('id')))
+            nodeLat.append(float(elem.get('lat')))
+            nodeLon.append(float(elem.get('lon')))
+            elem.clear()
+        elif elem.tag == 'way':
+            wid = int(elem.get('id'))
+            ways[wid] = np.array([int(nd.get('ref')) for nd in elem.iter('nd')], dtype=np.int64)
+            if any(tag.get('k') in NETWORK_KEYS for tag in elem.iter('tag')):
+                network.add(wid)
+            elem.clear()
+
+    order = np.argsort(nodeIds)
+    nodeIds = np.array(nodeIds, dtype=np.int64)[order]
+    nodeLat = np.array(nodeLat)[order]
+    nodeLon = np.array(nodeLon)[order]
+    # Long ways reach far out of the box, so the grid spans the bulk of the network nodes
+    onNetwork = np.isin(nodeIds, np.concatenate([ways[w] for w in network])) if network else np.ones(len(nodeIds), dtype=bool)
+    lat, lon = nodeLat[onNetwork], nodeLon[onNetwork]
+    bounds = (np.quantile(lat, 0.01), np.quantile(lon, 0.01), np.quantile(lat, 0.99), np.quantile(lon, 0.99))
+
+    def lookup(refs):
+        idx = np.clip(np.searchsorted(nodeIds, refs), 0, len(nodeIds) - 1)
+        return idx[nodeIds[idx] == refs]
+
+    # Owner tile of every network way: tile of the centroid of its (known) nodes
+    wayIds = [wid for wid in ways if wid in network]
+    centroids = np.zeros((len(wayIds), 2))
+    for i, wid in enumerate(wayIds):
+        idx = lookup(ways[wid])
+        if len(idx):
+            centroids[i] = nodeLat[idx].mean(), nodeLon[idx].mean()
+        else:
+            centroids[i] = bounds[0], bounds[1]
+    owner = dict(zip(wayIds, _centroidTiles(centroids[:, 0], centroids[:, 1], bounds, nx, ny).tolist()))
+
+    # Ways at every node, to add the neighbouring ways to each tile
+    nodeWays = {}
+    for wid, refs in ways.items():
+        for ref in refs.tolist():
+            nodeWays.setdefault(ref, []).append(wid)
+
+    tileWays = [set() for _ in range(nx * ny)]
+    for wid, tile in owner.items():
+        tileWays[tile].add(wid)
+    for tile, wids in enumerate(tileWays):
+        frontier = set(wids)
+        for _ in range(OVERLAP_RINGS):
+            grown = {n for wid in frontier for ref in ways[wid].tolist() for n in nodeWays[ref]} - wids
+            wids |= grown
+            frontier = grown
+
+    tileNodes = [set() for _ in range(nx * ny)]
+    for tile, wids in enumerate(tileWays):
+        for wid in wids:
+            tileNodes[tile].update(ways[wid].tolist())
+    return owner, tileWays, tileNodes, bounds
+
+# Step 1b - Write the Tile OSM Files
+def splitOSMIntoTiles(osmFile, outDir, nx, ny):
+    owner, tileWays, tileNodes, bounds = planTiles(osmFile, nx, ny)
+    base = os.path.join(outDir, os.path.basename(osmFile)[:-len('.osm.xml')])
+    tileFiles = [f'{base}_tile{t}.osm.xml' for t in range(nx * ny)]
+    outs = [open(f, 'w', encoding='utf-8') for f in tileFiles]
+    try:
+        for f in outs:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for _, elem in ET.iterparse(osmFile):
+            if elem.tag not in ('node', 'way', 'relation'):
+                continue
+            eid = int(elem.get('id'))
+            if elem.tag == 'node':
+                tiles = [t for t, nodes in enumerate(tileNodes) if eid in nodes]
+            elif elem.tag == 'way':
+                tiles = [t for t, wids in enumerate(tileWays) if eid in wids]
+            else:
+                # Relations (turn restrictions, routes) go to every tile with one of their member ways
+                members = {int(m.get('ref')) for m in elem.iter('member') if m.get('type') == 'way'}
+                tiles = [t for t, wids in enumerate(tileWays) if members & wids]
+            if tiles:
+                text = ET.tostring(elem, encoding='unicode')
+                for t in tiles:
+                    outs[t].write('  ' + text.strip() + '\n')
+            elem.clear()
+        for f in outs:
+            f.write('</osm>\n')
+    finally:
+        for f in outs:
+            f.close()
+    return tileFiles, owner, bounds
+
+def utmProjection(bounds):
+    south, west, north, east = bounds
+    lat, lon = (south + north) / 2, (west + east) / 2
+    zone = int((lon + 180) // 6) + 1
+    return f"+proj=utm +zone={zone}{' +south' if lat < 0 else ''} +ellps=WGS84 +datum=WGS84 +units=m +no_defs"
+
+# Step 2 - Convert a Tile to Plain XML
+def convertTile(governor, tileFile, plainPrefix, proj, netconvertOptions=()):
+    cmd = ['netconvert', '--osm-files', tileFile, '--proj', proj, '--offset.disable-normalization', 'true',
+           '--plain-output-prefix', plainPrefix] + list(netconvertOptions)
+    governor.run(cmd, 'netconvert-tile', os.path.getsize(tileFile), check=True, capture_output=True)
+    return plainPrefix
+
+def _edgeWay(edgeId):
+    return int(edgeId.lstrip('-').split('#')[0])
+
+def _isOwn(edgeId, owner, tile):
+    try:
+        return owner.get(_edgeWay(edgeId)) == tile
+    except ValueError:
+        return False
+
+# Way and direction of an edge id: '-123#2' -> '-123'
+def _edgeBase(edgeId):
+    return edgeId.split('#')[0]
+
+# Step 3 - Stitch the Plain XML of all Tiles
+# plainPrefixes: tile index -> plain output prefix of the tile
+def stitchTiles(plainPrefixes, owner, outPrefix):
+    nodes, edges, types, connections = {}, {}, {}, []
+    crossTile = []      # (connection, node where the 'to' edge must start)
+    location = None
+    for tile, prefix in sorted(plainPrefixes.items()):
+        tileEdges = {}
+        for edge in ET.parse(prefix + '.edg.xml').getroot().iter('edge'):
+            if _isOwn(edge.get('id'), owner, tile):
+                tileEdges[edge.get('id')] = edge
+        edges.update(tileEdges)
+
+        used = {e.get('from') for e in tileEdges.values()} | {e.get('to') for e in tileEdges.values()}
+        nodRoot = ET.parse(prefix + '.nod.xml').getroot()
+        if location is None:
+            location = nodRoot.find('location')
+        for node in nodRoot.iter('node'):
+            # Boundary nodes appear in several tiles, keep the first copy
+            if node.get('id') in used and node.get('id') not in nodes:
+                nodes[node.get('id')] = node
+
+        if os.path.exists(prefix + '.typ.xml'):
+            for t in ET.parse(prefix + '.typ.xml').getroot().iter('type'):
+                types.setdefault(t.get('id'), t)
+        if os.path.exists(prefix + '.con.xml'):
+            for c in ET.parse(prefix + '.con.xml').getroot():
+                if c.tag != 'connection' or c.get('from') not in tileEdges:
+                    continue
+                # <connection from="E"/> without 'to': E has no successors
+                if c.get('to') is None or _isOwn(c.get('to'), owner, tile):
+                    connections.append(c)
+                else:
+                    crossTile.append((c, tileEdges[c.get('from')].get('to')))
+
+    # Same way and direction, starting at the end node of the 'from' edge
+    byStart = {(_edgeBase(eid), e.get('from')): eid for eid, e in edges.items()}
+    for c, node in crossTile:
+        to = byStart.get((_edgeBase(c.get('to')), node))
+        if to is not None:
+            c.set('to', to)
+            connections.append(c)
+
+    # Connections into edges that did not make it into the stitched net are dropped (netconvert guesses them)
+    connections = [c for c in connections if c.get('to') is None or c.get('to') in edges]
+
+    def write(fileName, rootTag, elements):
+        with open(fileName, 'w', encoding='utf-8') as f:
+            f.write(f'<{rootTag}>\n')
+            for e in elements:
+                f.write('    ' + ET.tostring(e, encoding='unicode').strip() + '\n')
+            f.write(f'</{rootTag}>\n')
+
+    write(outPrefix + '.nod.xml', 'nodes', ([location] if location is not None else []) + list(nodes.values()))
+    write(outPrefix + '.edg.xml', 'edges', edges.values())
+    write(outPrefix + '.typ.xml', 'types', types.values())
+    write(outPrefix + '.con.xml', 'connections', connections)
+    return outPrefix
+
+# workDir keeps the tiles and the plain files, by default they go to a temporary folder
+def buildTiledNet(osmFile, netFile, nx=2, ny=2, workDir=None, governor=None, netconvertOptions=()):
+    if workDir is None:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            return buildTiledNet(osmFile, netFile, nx, ny, tmpDir, governor, netconvertOptions)
+    os.makedirs(workDir, exist_ok=True)
+    governor = governor or MemoryGovernor()
+
+    tileFiles, owner, bounds = splitOSMIntoTiles(osmFile, workDir, nx, ny)
+    proj = utmProjection(bounds)
+    # Tiles without ways of their own contribute nothing
+    tiles = sorted(set(owner.values()))
+    prefixes = {t: tileFiles[t][:-len('.osm.xml')] for t in tiles}
+    with ThreadPoolExecutor(len(tiles)) as executor:
+        list(executor.map(lambda t: convertTile(governor, tileFiles[t], prefixes[t], proj, netconvertOptions), tiles))
+
+    stitched = stitchTiles(prefixes, owner, os.path.join(workDir, 'stitched'))
+    cmd = ['netconvert', '--node-files', stitched + '.nod.xml', '--edge-files', stitched + '.edg.xml',
+           '--type-files', stitched + '.typ.xml', '--connection-files', stitched + '.con.xml', '-o', netFile] + list(netconvertOptions)
+    governor.run(cmd, 'netconvert', os.path.getsize(osmFile), check=True, capture_output=True)
+    return netFile
+
+# Edges, junctions, (from, to) edge connections, traffic light programs and weakly connected components of a .net.xml
+def netStats(netFile):
+    edges = {}
+    junctions = set()
+    connections = set()
+    tlLogics = {}
+    for _, elem in ET.iterparse(netFile):
+        if elem.tag == 'edge' and elem.get('function') != 'internal':
+            edges[elem.get('id')] = (elem.get('from'), elem.get('to'))
+            elem.clear()
+        elif elem.tag == 'junction' and elem.get('type') != 'internal':
+            junctions.add(elem.get('id'))
+            elem.clear()
+        elif elem.tag == 'connection' and not elem.get('from').startswith(':'):
+            connections.add((elem.get('from'), elem.get('to')))
+            elem.clear()
+        elif elem.tag == 'tlLogic':
+            tlLogics[elem.get('id')] = tuple((p.get('duration'), p.get('state')) for p in elem.iter('phase'))
+            elem.clear()
+
+    parent = {}
+    def find(a):
+        parent.setdefault(a, a)
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+    for a, b in edges.values():
+        parent[find(a)] = find(b)
+    components = len({find(n) for n in list(parent)})
+    return {'edges': len(edges), 'junctions': len(junctions), 'connections': len(connections), 'tls': len(tlLogics),
+            'components': components, 'edgeIds': set(edges), 'junctionIds': junctions, 'connectionPairs': connections,
+            'tlLogics': set(tlLogics.items())}
+
+# Options in the configuration header netconvert writes into a .net.xml
+def netOptions(netFile):
+    header = []
+    with open(netFile, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('<net '):
+                break
+            header.append(line)
+    text = ''.join(header)
+    start, end = text.find('<netconvertConfiguration'), text.find('</netconvertConfiguration>')
+    if start < 0 or end < 0:
+        return set()
+    root = ET.fromstring(text[start:end + len('</netconvertConfiguration>')])
+    return {option.tag for group in root for option in group}
+
+# Compare the tiled build mode of bursa.convertOSMToSUMONet with its monolithic build
+# (netconvertOptions=None builds with bursa.NETCONVERT_OPTIONS)
+def validateTiledBuild(osmFile, workDir, nx=2, ny=2, netconvertOptions=None):
+    from bursa import convertOSMToSUMONet
+    name = os.path.basename(osmFile)[:-len('.osm.xml')]
+    monolithic = os.path.join(workDir, name + '_mono.net.xml')
+    tiled = os.path.join(workDir, name + '_tiled.net.xml')
+    convertOSMToSUMONet(osmFile, monolithic, netconvertOptions=netconvertOptions)
+    convertOSMToSUMONet(osmFile, tiled, tiles=(nx, ny), netconvertOptions=netconvertOptions)
+    a, b = netStats(monolithic), netStats(tiled)
+    # The options of the tiles must also be in the final net
+    a['options'] = {o.lstrip('-') for o in netconvertOptions or () if o.startswith('--')}
+    b['options'] = a['options'] & netOptions(tiled)
+    ok = (a['components'] == b['components'] and a['options'] == b['options'] and
+          all(a[key] == b[key] for key in ('edgeIds', 'junctionIds', 'connectionPairs', 'tlLogics')))
+    return ok, a, b
+
+if __name__ == '__main__':
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'my_data2', 'osm')
+    # The nets are written to the given folder, or to a temporary one
+    tmpDir = None if len(sys.argv) > 1 else tempfile.TemporaryDirectory()
+    workDir = sys.argv[1] if tmpDir is None else tmpDir.name
+    os.makedirs(workDir, exist_ok=True)
+
+    allOk = True
+    for options in (None, VALIDATION_OPTIONS):
+        print(f"netconvert options: {' '.join(options) if options else 'bursa.NETCONVERT_OPTIONS'}")
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith('.osm.xml'):
+                continue
+            ok, a, b = validateTiledBuild(os.path.join(folder, name), workDir, netconvertOptions=options)
+            allOk = allOk and ok
+            print(f"{name}: {'ok' if ok else 'MISMATCH'} (edges {a['edges']}/{b['edges']}, junctions {a['junctions']}/{b['junctions']}, "
+                  f"connections {a['connections']}/{b['connections']}, tls {a['tls']}/{b['tls']}, components {a['components']}/{b['components']})")
+            if not ok:
+                for key in ('edgeIds', 'junctionIds', 'connectionPairs', 'tlLogics', 'options'):
+                    missing, extra = a[key] - b[key], b[key] - a[key]
+                    if missing or extra:
+                        print(f"  {key}: {len(missing)} missing, {len(extra)} extra, e.g. {sorted(missing)[:3]} {sorted(extra)[:3]}")
+    if tmpDir is not None:
+        tmpDir.cleanup()
+    sys.exit(0 if allOk else 1)
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from traceStream import ActiveVehicles, iterFCD
+
+# Checks that two mobility traces (FCD *_trace.xml or ns2 *_trace.ns2) describe
+# the same movement, e.g. after changing a converter, thinning, sharding or
+# routing in parallel. Both traces are loaded into arrays of (vehicle, time,
+# x, y, speed) rows and aligned on (vehicle, time), so the order of the lines
+# and the number formatting do not matter. ns2 traces only know node indices;
+# when an FCD trace is compared with an ns2 trace the FCD vehicle ids are
+# mapped to the indices traceExporter.py gives them.
+
+POS_TOLERANCE = 0.01     # m, ns2 positions are written with 2 decimals
+SPEED_TOLERANCE = 0.01   # m/s
+TIME_RESOLUTION = 1000   # Times are matched in ms
+
+# Step 1 - Load a Trace into Arrays
+def loadFCD(traceFile, ns2Ids=False):
+    ids, times, xs, ys, speeds = [], [], [], [], []
+    active = ActiveVehicles() if ns2Ids else None
+    for t, vehicles in iterFCD(traceFile):
+        if active is not None:
+            vehicles = [v for _, _, v in active.update(vehicles)[0]]
+            vids = [str(active.ids[v['id']]) for v in vehicles]
+        else:
+            vids = [v['id'] for v in vehicles]
+        ids.extend(vids)
+        times.extend([t] * len(vehicles))
+        xs.extend([v['x'] for v in vehicles])
+        ys.extend([v['y'] for v in vehicles])
+        speeds.extend([v.get('speed', '0') for v in vehicles])
+    return _toArrays(ids, times, xs, ys, speeds)
+
+def loadNS2(ns2File):
+    ids, times, xs, ys, speeds = [], [], [], [], []
+    with open(ns2File) as f:
+        for line in f:
+            # $ns_ at t "$node_(N) setdest x y speed"
+            if line.startswith('$ns_ at '):
+                parts = line.split()
+                times.append(parts[2])
+                ids.append(parts[3][8:-1])
+                xs.append(parts[5])
+                ys.append(parts[6])
+                speeds.append(parts[7][:-1])
+    return _toArrays(ids, times, xs, ys, speeds)
+
+def _toArrays(ids, times, xs, ys, speeds):
+    return {'id': np.array(ids, dtype=object),
+            'time': np.array(times, dtype=np.float64),
+            'x': np.array(xs, dtype=np.float64),
+            'y': np.array(ys, dtype=np.float64),
+            'speed': np.array(speeds, dtype=np.float64)}
+
+def isNS2(traceFile):
+    return traceFile.endswith(('.ns2', '.tcl'))
+
+def loadTrace(traceFile, ns2Ids=False):
+    return loadNS2(traceFile) if isNS2(traceFile) else loadFCD(traceFile, ns2Ids)
+
+# Step 2 - Align on (vehicle, time)
+def _alignment(a, b):
+    vehicles, vehicleCodes = np.unique(np.concatenate([a['id'], b['id']]).astype(str), return_inverse=True)
+    ticks = np.rint(np.concatenate([a['time'], b['time']]) * TIME_RESOLUTION).astype(np.int64)
+    ticks, timeCodes = np.unique(ticks, return_inverse=True)
+    keys = vehicleCodes.astype(np.int64) * len(ticks) + timeCodes
+    n = len(a['id'])
+    return vehicles, ticks / TIME_RESOLUTION, keys[:n], keys[n:]
+
+def _firstEvent(keys, numTimes, vehicles, times, kind):
+    # Earliest (time, vehicle) among keys
+    if not len(keys):
+        return None
+    t, v = keys % numTimes, keys // numTimes
+    i = np.lexsort((v, t))[0]
+    return {'time': float(times[t[i]]), 'vehicle': str(vehicles[v[i]]), 'kind': kind}
+
+# Step 3 - Compare two Traces
+def compareTraces(fileA, fileB, posTolerance=POS_TOLERANCE, speedTolerance=SPEED_TOLERANCE):
+    # Mixed formats are compared on ns2 node indices
+    mixed = isNS2(fileA) != isNS2(fileB)
+    a, b = loadTrace(fileA, mixed), loadTrace(fileB, mixed)
+    vehicles, times, keysA, keysB = _alignment(a, b)
+    numTimes = len(times)
+
+    dupA, dupB = len(keysA) - len(np.unique(keysA)), len(keysB) - len(np.unique(keysB))
+    common, ia, ib = np.intersect1d(keysA, keysB, assume_unique=False, return_indices=True)
+    onlyA = np.setdiff1d(keysA, keysB)
+    onlyB = np.setdiff1d(keysB, keysA)
+
+    posDev = np.hypot(a['x'][ia] - b['x'][ib], a['y'][ia] - b['y'][ib])
+    speedDev = np.abs(a['speed'][ia] - b['speed'][ib])
+    bad = common[(posDev > posTolerance) | (speedDev > speedTolerance)]
+
+    vehA, vehB = np.unique(keysA // numTimes), np.unique(keysB // numTimes)
+    timeA, timeB = np.unique(keysA % numTimes), np.unique(keysB % numTimes)
+
+    events = [e for e in (_firstEvent(bad, numTimes, vehicles, times, 'deviation'),
+                          _firstEvent(onlyA, numTimes, vehicles, times, 'missing in B'),
+                          _firstEvent(onlyB, numTimes, vehicles, times, 'missing in A')) if e]
+    firstDivergence = min(events, key=lambda e: (e['time'], e['vehicle'])) if events else None
+
+    def stat(dev, fn):
+        return float(fn(dev)) if len(dev) else 0.0
+
+    report = {
+        'rowsA': len(keysA), 'rowsB': len(keysB), 'matched': len(common),
+        'duplicateRowsA': dupA, 'duplicateRowsB': dupB,
+        'onlyInA': len(onlyA), 'onlyInB': len(onlyB),
+        'vehiclesOnlyInA': vehicles[np.setdiff1d(vehA, vehB)].tolist(),
+        'vehiclesOnlyInB': vehicles[np.setdiff1d(vehB, vehA)].tolist(),
+        'timestepsOnlyInA': times[np.setdiff1d(timeA, timeB)].tolist(),
+        'timestepsOnlyInB': times[np.setdiff1d(timeB, timeA)].tolist(),
+        'maxPositionDeviation': stat(posDev, np.max), 'meanPositionDeviation': stat(posDev, np.mean),
+        'maxSpeedDeviation': stat(speedDev, np.max), 'meanSpeedDeviation': stat(speedDev, np.mean),
+        'deviatingRows': len(bad),
+        'firstDivergence': firstDivergence,
+    }
+    report['equivalent'] = firstDivergence is None and not dupA and not dupB
+    return report
+
+def formatReport(report, limit=5):
+    def few(values):
+        return ', '.join(str(v) for v in values[:limit]) + (' ...' if len(values) > limit else '')
+    lines = [f"{'EQUIVALENT' if report['equivalent'] else 'DIFFERENT'}: {report['matched']} matched rows "
+             f"({report['rowsA']} / {report['rowsB']}), {report['onlyInA']} only in A, {report['onlyInB']} only in B",
+             f"  position deviation max {report['maxPositionDeviation']:.4f} m, mean {report['meanPositionDeviation']:.6f} m",
+             f"  speed deviation max {report['maxSpeedDeviation']:.4f} m/s, mean {report['meanSpeedDeviation']:.6f} m/s"]
+    for key in ('vehiclesOnlyInA', 'vehiclesOnlyInB', 'timestepsOnlyInA', 'timestepsOnlyInB'):
+        if report[key]:
+            lines.append(f"  {key}: {len(report[key])} ({few(report[key])})")
+    if report['duplicateRowsA'] or report['duplicateRowsB']:
+        lines.append(f"  duplicate (vehicle, time) rows: {report['duplicateRowsA']} / {report['duplicateRowsB']}")
+    if report['firstDivergence']:
+        e = report['firstDivergence']
+        lines.append(f"  first divergence at t={e['time']} vehicle {e['vehicle']} ({e['kind']})")
+    return '\n'.join(lines)
+
+def _compareJob(pair):
+    return pair, compareTraces(*pair)
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    if len(sys.argv) == 3:
+        report = compareTraces(sys.argv[1], sys.argv[2])
+        print(formatReport(report))
+    else:
+        # Check every FCD trace of the Bursa data against its ns2 conversion
+        folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'my_data2', 'osm')
+        pairs = [(os.path.join(folder, name), os.path.join(folder, name[:-len('.xml')] + '.ns2'))
+                 for name in sorted(os.listdir(folder)) if name.endswith('_trace.xml')]
+        pairs = [p for p in pairs if os.path.exists(p[1])]
+        with Pool(os.cpu_count()) as pool:
+            results = pool.map(_compareJob, pairs)
+        for (fileA, _), report in results:
+            print(f"{os.path.basename(fileA)}: {formatReport(report)}")
+        report = {'equivalent': all(r['equivalent'] for _, r in results)}
+    print(f"{time.perf_counter() - start:.2f}s")
+    sys.exit(0 if report['equivalent'] else 1)
@@ -0,0 +1,305 @@
+#!/usr/bin/python
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from traceStream import ActiveVehicles, NS2MobilityWriter, streamTrace
+
+# Several mobility formats from one streaming parse of the FCD trace instead
+# of one traceExporter.py run (and one parse) per format. The ns2 and OMNeT++
+# writers produce the same output as traceExporter.py. ONE and BonnMotion are
+# not offered by traceExporter.py, they follow the input formats of the ONE
+# simulator (ExternalMovement) and BonnMotion (.movements).
+
+SUMO_HOME = r"C:\Program Files (x86)\Eclipse\Sumo"
+
+# ns2 activity/config need the life time of every node and the covered area
+class NS2InfoCollector:
+    def begin(self):
+        self.active = ActiveVehicles()
+        self.vehInfo = {}
+        self.beginTime = None
+        self.endTime = None
+        self.area = [None, None, None, None]
+
+    def timestep(self, t, vehicles):
+        if self.beginTime is None:
+            self.beginTime = t
+        self.endTime = t
+        seen, left = self.active.update(vehicles)
+        for vid in left:
+            self.vehInfo[vid][2] = t
+        area = self.area
+        for nid, isNew, v in seen:
+            x, y = float(v['x']), float(v['y'])
+            if isNew:
+                self.vehInfo[v['id']] = [nid, t, 0]
+            # Same (re)initialisation as traceExporter.py, including for a minimum x of 0
+            if not area[0]:
+                area[0] = area[2] = x
+                area[1] = area[3] = y
+            area[0] = min(area[0], x)
+            area[1] = min(area[1], y)
+            area[2] = max(area[2], x)
+            area[3] = max(area[3], y)
+
+    def end(self):
+        pass
+
+class NS2ActivityWriter(NS2InfoCollector):
+    def __init__(self, outFile):
+        self.outFile = outFile
+
+    def end(self):
+        with open(self.outFile, 'w') as f:
+            for vid in sorted(self.vehInfo):
+                nid, start, stop = self.vehInfo[vid]
+                f.write(f'$ns_ at {start} "$g({nid}) start"; # SUMO-ID: {vid}\n')
+                f.write(f'$ns_ at {stop} "$g({nid}) stop"; # SUMO-ID: {vid}\n')
+
+class NS2ConfigWriter(NS2InfoCollector):
+    def __init__(self, outFile, activityFile=None, mobilityFile=None):
+        self.outFile = outFile
+        self.activityFile = activityFile
+        self.mobilityFile = mobilityFile
+
+    def end(self):
+        xmin, ymin, xmax, ymax = self.area
+        with open(self.outFile, 'w') as f:
+            f.write(f'# set number of nodes\nset opt(nn) {len(self.vehInfo)}\n\n')
+            if self.activityFile:
+                f.write(f'# set activity file\nset opt(af) $opt(config-path)\nappend opt(af) /{self.activityFile}\n\n')
+            if self.mobilityFile:
+                f.write(f'# set mobility file\nset opt(mf) $opt(config-path)\nappend opt(mf) /{self.mobilityFile}\n\n')
+            f.write(f'# set start/stop time\nset opt(start) {self.beginTime}\nset opt(stop) {self.endTime}\n\n')
+            f.write(f'# set floor size\nset opt(x) {xmax}\nset opt(y) {ymax}\nset opt(min-x) {xmin}\nset opt(min-y) {ymin}\n\n')
+
+class OMNeTWriter:
+    def __init__(self, outFile, app='traceExporter.py'):
+        self.outFile = outFile
+        self.app = app
+
+    def begin(self):
+        self.f = open(self.outFile, 'w')
+        self.f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        self.f.write('<xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="mobility_trace.xsd">\n')
+        self.f.write(f'<!-- generated on {datetime.datetime.now()} by {self.app} -->\n\n')
+        self.f.write('<mobility_trace>\n')
+        # Unlike ns2, a vehicle that comes back gets a new node id
+        self.ids = {}
+        self.nextIndex = 0
+
+    def _destroyMissing(self, t, seen):
+        lines = []
+        for vid in sorted(self.ids):
+            if vid not in seen:
+                lines.append(f'  <destroy><time>{t}</time><nodeid>{self.ids.pop(vid)}</nodeid></destroy>\n')
+        self.f.writelines(lines)
+
+    def timestep(self, t, vehicles):
+        seen = set()
+        lines = []
+        for v in vehicles:
+            vid = v['id']
+            seen.add(vid)
+            x, y = float(v['x']), float(v['y'])
+            if vid not in self.ids:
+                nid = self.ids[vid] = self.nextIndex
+                self.nextIndex += 1
+                lines.append(f'  <create><nodeid>{nid}</nodeid><time>{t}</time><type>SimpleNode</type><location><xpos>{x}</xpos><ypos>{y}</ypos></location></create>\n')
+            else:
+                lines.append(f'  <waypoint><nodeid>{self.ids[vid]}</nodeid><time>{t}</time><destination><xpos>{x}</xpos><ypos>{y}</ypos></destination><speed>{v["speed"]}</speed></waypoint>\n')
+        self.f.writelines(lines)
+        self._destroyMissing(t, seen)
+
+    def end(self):
+        self.f.write('</mobility_trace>\n')
+        self.f.close()
+
+# ONE ExternalMovement: bounds header followed by "time id x y" lines
+class ONEWriter:
+    def __init__(self, outFile):
+        self.outFile = outFile
+
+    def begin(self):
+        # The header needs the bounds of the whole trace, so the body is buffered in a temp file
+        self.body = tempfile.TemporaryFile('w+', dir=os.path.dirname(os.path.abspath(self.outFile)))
+        self.active = ActiveVehicles()
+        self.bounds = None
+
+    def timestep(self, t, vehicles):
+        seen, _ = self.active.update(vehicles)
+        lines = []
+        for nid, _, v in seen:
+            x, y = float(v['x']), float(v['y'])
+            if self.bounds is None:
+                self.bounds = [t, t, x, x, y, y]
+            b = self.bounds
+            b[1] = t
+            b[2], b[3] = min(b[2], x), max(b[3], x)
+            b[4], b[5] = min(b[4], y), max(b[5], y)
+            lines.append(f'{t} {nid} {x} {y}\n')
+        self.body.writelines(lines)
+
+    def end(self):
+        b = self.bounds or [0, 0, 0, 0, 0, 0]
+        with open(self.outFile, 'w') as f:
+            f.write(f'{b[0]} {b[1]} {b[2]} {b[3]} {b[4]} {b[5]} 0 0\n')
+            self.body.seek(0)
+            for chunk in iter(lambda: self.body.read(1 << 20), ''):
+                f.write(chunk)
+        self.body.close()
+
+# BonnMotion .movements: one line "t x y t x y ..." per node, in node order
+class BonnMotionWriter:
+    def __init__(self, outFile):
+        self.outFile = outFile
+
+    def begin(self):
+        # Finished nodes are spooled to a temp file and put in node order at the end,
+        # so only the waypoints of the active nodes are kept in memory
+        self.spool = tempfile.TemporaryFile('w+', dir=os.path.dirname(os.path.abspath(self.outFile)))
+        self.active = ActiveVehicles()
+        self.waypoints = {}
+        self.offsets = {}
+
+    def _flush(self, nid):
+        line = ' '.join(self.waypoints.pop(nid)) + '\n'
+        self.offsets[nid] = (self.spool.tell(), len(line))
+        self.spool.write(line)
+
+    def timestep(self, t, vehicles):
+        ids = dict(self.active.ids)
+        seen, left = self.active.update(vehicles)
+        for vid in left:
+            self._flush(ids[vid])
+        for nid, _, v in seen:
+            self.waypoints.setdefault(nid, []).append(f'{t} {float(v["x"])} {float(v["y"])}')
+
+    def end(self):
+        for nid in list(self.waypoints):
+            self._flush(nid)
+        with open(self.outFile, 'w') as f:
+            for nid in sorted(self.offsets):
+                offset, length = self.offsets[nid]
+                self.spool.seek(offset)
+                f.write(self.spool.read(length))
+        self.spool.close()
+
+EXPORT_FORMATS = ('ns2mobility', 'ns2config', 'ns2activity', 'omnet', 'one', 'bonnmotion')
+
+def _exportWriters(outputs):
+    writers = []
+    for fmt, outFile in outputs.items():
+        if fmt == 'ns2mobility':
+            writers.append(NS2MobilityWriter(outFile))
+        elif fmt == 'ns2config':
+            writers.append(NS2ConfigWriter(outFile, outputs.get('ns2activity'), outputs.get('ns2mobility')))
+        elif fmt == 'ns2activity':
+            writers.append(NS2ActivityWriter(outFile))
+        elif fmt == 'omnet':
+            writers.append(OMNeTWriter(outFile))
+        elif fmt == 'one':
+            writers.append(ONEWriter(outFile))
+        elif fmt == 'bonnmotion':
+            writers.append(BonnMotionWriter(outFile))
+        else:
+            raise ValueError(f"Unknown export format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}")
+    return writers
+
+# Step 6 - Export the Trace to Several Formats (outputs: format -> output file)
+def exportTrace(traceFile, outputs, extraConsumers=()):
+    streamTrace(traceFile, _exportWriters(outputs) + list(extraConsumers))
+
+def exportFileNames(fname, formats):
+    suffixes = {'ns2mobility': '_trace.ns2', 'ns2config': '_trace.tcl', 'ns2activity': '_activity.tcl',
+                'omnet': '_omnet.xml', 'one': '_one.txt', 'bonnmotion': '.movements'}
+    return {fmt: fname + suffixes[fmt] for fmt in formats}
+
+# traceExporter.py options of the formats it offers
+EXPORTER_OPTIONS = {'ns2mobility': '--ns2mobility-output', 'ns2config': '--ns2config-output',
+                    'ns2activity': '--ns2activity-output', 'omnet': '--omnet-output'}
+
+# Benchmark one shared parse against one parse per format (and against traceExporter.py when available,
+# which writes the same files into outDir/traceExporter)
+def benchmarkExport(traceFile, formats, outDir):
+    base = os.path.join(outDir, os.path.basename(traceFile)[:-len('_trace.xml')])
+    outputs = exportFileNames(base, formats)
+
+    # One parse per format first, the kept files are those of the shared parse
+    # (ns2config alone does not reference the activity and mobility files)
+    start = time.perf_counter()
+    for fmt in formats:
+        exportTrace(traceFile, {fmt: outputs[fmt]})
+    separate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exportTrace(traceFile, outputs)
+    single = time.perf_counter() - start
+
+    exporter = os.path.join(SUMO_HOME, 'tools', 'traceExporter.py')
+    external = None
+    if os.path.exists(exporter):
+        import subprocess
+        refDir = os.path.join(outDir, 'traceExporter')
+        os.makedirs(refDir, exist_ok=True)
+        cmd = [sys.executable, exporter, '--fcd-input', traceFile]
+        for fmt in formats:
+            if fmt in EXPORTER_OPTIONS:
+                cmd += [EXPORTER_OPTIONS[fmt], os.path.join(refDir, os.path.basename(outputs[fmt]))]
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, capture_output=True)
+        external = time.perf_counter() - start
+    return single, separate, external
+
+def _readOutput(fileName, fmt, folder):
+    with open(fileName) as f:
+        lines = f.readlines()
+    if fmt == 'omnet':
+        # The generated-on line carries a timestamp
+        lines = [line for line in lines if not line.startswith('<!-- generated on')]
+    elif fmt == 'ns2config':
+        # The activity / mobility file names include the output folder
+        lines = [line.replace(folder, '') for line in lines]
+    return lines
+
+# Formats whose output differs from the traceExporter.py output in outDir/traceExporter
+def compareWithExporter(traceFile, formats, outDir):
+    base = os.path.basename(traceFile)[:-len('_trace.xml')]
+    outputs = exportFileNames(os.path.join(outDir, base), formats)
+    refDir = os.path.join(outDir, 'traceExporter')
+    return [fmt for fmt in formats if fmt in EXPORTER_OPTIONS and
+            _readOutput(outputs[fmt], fmt, outDir) != _readOutput(os.path.join(refDir, os.path.basename(outputs[fmt])), fmt, refDir)]
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'my_data2', 'osm')
+    formats = list(EXPORT_FORMATS)
+
+    with tempfile.TemporaryDirectory() as outDir:
+        total = [0.0, 0.0, 0.0]
+        same = True
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith('_trace.xml'):
+                continue
+            traceFile = os.path.join(folder, name)
+            single, separate, external = benchmarkExport(traceFile, formats, outDir)
+
+            if external is not None:
+                # ns2 and OMNeT++ outputs must be identical to the traceExporter.py outputs
+                different = compareWithExporter(traceFile, formats, outDir)
+                check = 'same as traceExporter' if not different else 'different from traceExporter: ' + ', '.join(different)
+            else:
+                # Without SUMO, the ns2 mobility output must be identical to the checked-in traceExporter.py output
+                with open(traceFile[:-len('.xml')] + '.ns2') as a, open(os.path.join(outDir, name[:-len('.xml')] + '.ns2')) as b:
+                    different = a.read() != b.read()
+                check = f"ns2 identical: {not different}"
+            same = same and not different
+            print(f"{name}: one parse {single:.2f}s, {len(formats)} parses {separate:.2f}s" + (f", traceExporter {external:.2f}s" if external is not None else '') + f", {check}")
+            total[0] += single
+            total[1] += separate
+            total[2] += external or 0.0
+        print(f"Total: one parse {total[0]:.2f}s, {len(formats)} parses {total[1]:.2f}s" + (f", traceExporter {total[2]:.2f}s" if total[2] else ''))
+    sys.exit(0 if same else 1)
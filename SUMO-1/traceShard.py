@@ -0,0 +1,237 @@
+#!/usr/bin/python
+
+import heapq
+import json
+import math
+import os
+from multiprocessing import Pool
+
+# Splits an ns2 mobility trace (*_trace.ns2 / *_trace.tcl) into shards that
+# can be simulated independently:
+#  - time windows: every shard starts with the state (position and ongoing
+#    setdest) of all nodes alive at the window start, followed by the original
+#    lines of the window. The injected lines are enclosed in marker comments,
+#    so concatenating the shards without them gives back the original file.
+#  - regions: every node goes, with all its lines, to the grid cell of its
+#    initial position.
+# A JSON manifest lists the shards.
+
+STATE_BEGIN = '# shard initial state begin\n'
+STATE_END = '# shard initial state end\n'
+
+def _parseSet(line):
+    # $node_(N) set X_ value
+    parts = line.split()
+    return int(parts[0][7:-1]), parts[2][0], parts[3]
+
+def _parseSetdest(line):
+    # $ns_ at t "$node_(N) setdest x y speed"
+    parts = line.split()
+    return float(parts[2]), int(parts[3][8:-1]), parts[5], parts[6], parts[7][:-1]
+
+# Pass 1 - Life Time and Initial Position of every Node
+def scanNS2(ns2File):
+    first, last, initial = {}, {}, {}
+    endTime = None
+    with open(ns2File) as f:
+        for line in f:
+            if line.startswith('$ns_ at '):
+                t, nid, _, _, _ = _parseSetdest(line)
+                first.setdefault(nid, t)
+                last[nid] = t
+                endTime = t
+            elif line.startswith('$node_('):
+                nid, coord, value = _parseSet(line)
+                initial.setdefault(nid, {})[coord] = float(value)
+    return first, last, initial, endTime
+
+class _NodeState:
+    __slots__ = ('x', 'y', 'z', 't', 'destX', 'destY', 'speed')
+
+    def __init__(self):
+        self.x = self.y = self.z = 0.0
+        self.t = 0.0
+        self.destX = self.destY = None
+        self.speed = '0'
+
+    # Position at time t when moving from (x, y) at self.t towards the last setdest
+    def positionAt(self, t):
+        if self.destX is None:
+            return self.x, self.y
+        dx, dy = float(self.destX) - self.x, float(self.destY) - self.y
+        dist = math.hypot(dx, dy)
+        travelled = float(self.speed) * (t - self.t)
+        if dist == 0.0 or travelled >= dist:
+            return float(self.destX), float(self.destY)
+        return self.x + dx * travelled / dist, self.y + dy * travelled / dist
+
+def _stateBlock(k, t0, t1, states):
+    lines = [STATE_BEGIN, f'# shard {k}: [{t0}, {t1})\n']
+    for nid in sorted(states):
+        s = states[nid]
+        x, y = s.positionAt(t0)
+        lines.append(f'$node_({nid}) set X_ {x}\n$node_({nid}) set Y_ {y}\n$node_({nid}) set Z_ {s.z}\n')
+        if s.destX is not None and (x, y) != (float(s.destX), float(s.destY)):
+            lines.append(f'$ns_ at {t0} "$node_({nid}) setdest {s.destX} {s.destY} {s.speed}"\n')
+    lines.append(STATE_END)
+    return ''.join(lines)
+
+# Pass 2 - Byte Ranges and Initial States of the Time Windows
+def _planTimeShards(ns2File, windowLength, first, last, endTime):
+    numWindows = int(endTime // windowLength) + 1
+    bounds = [k * windowLength for k in range(numWindows + 1)]
+    cuts = [0]
+    blocks = [_stateBlock(0, bounds[0], bounds[1], {})]
+    states = {}
+    k = 1
+    offset = 0
+    pending = None  # offset of 'set' lines that belong to the next setdest
+    with open(ns2File, 'rb') as f:
+        for raw in f:
+            line = raw.decode()
+            if line.startswith('$ns_ at '):
+                t, nid, x, y, speed = _parseSetdest(line)
+                while k < numWindows and t >= bounds[k]:
+                    cuts.append(pending if pending is not None else offset)
+                    t0 = bounds[k]
+                    alive = {n: s for n, s in states.items() if first[n] < t0 <= last[n]}
+                    blocks.append(_stateBlock(k, t0, bounds[k + 1], alive))
+                    k += 1
+                pending = None
+                s = states[nid]
+                s.x, s.y = s.positionAt(t)
+                s.t, s.destX, s.destY, s.speed = t, x, y, speed
+            elif line.startswith('$node_('):
+                if pending is None:
+                    pending = offset
+                nid, coord, value = _parseSet(line)
+                s = states.setdefault(nid, _NodeState())
+                setattr(s, coord.lower(), float(value))
+            offset += len(raw)
+    while k < numWindows:
+        cuts.append(offset)
+        blocks.append(_stateBlock(k, bounds[k], bounds[k + 1], {}))
+        k += 1
+    cuts.append(offset)
+    return bounds, cuts, blocks
+
+def _writeTimeShard(ns2File, outFile, block, start, stop):
+    with open(outFile, 'w') as out:
+        out.write(block)
+    with open(ns2File, 'rb') as src, open(outFile, 'ab') as out:
+        src.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = src.read(min(remaining, 1 << 20))
+            out.write(chunk)
+            remaining -= len(chunk)
+    return outFile
+
+def _writeRegionShard(ns2File, outFile, nodes):
+    nodes = set(nodes)
+    with open(ns2File) as src, open(outFile, 'w') as out:
+        for line in src:
+            if line.startswith('$ns_ at '):
+                nid = _parseSetdest(line)[1]
+            elif line.startswith('$node_('):
+                nid = _parseSet(line)[0]
+            else:
+                continue
+            if nid in nodes:
+                out.write(line)
+    return outFile
+
+def _shardFiles(ns2File, mode, count):
+    base, ext = os.path.splitext(ns2File)
+    return [f'{base}_{mode}{k}{ext}' for k in range(count)]
+
+# mode: 'time' or 'region'
+def manifestFileFor(ns2File, mode):
+    return os.path.splitext(ns2File)[0] + f'_{mode}Shards.json'
+
+# Shard by time windows of windowLength seconds
+def shardByTime(ns2File, windowLength, processes=None):
+    first, last, _, endTime = scanNS2(ns2File)
+    bounds, cuts, blocks = _planTimeShards(ns2File, windowLength, first, last, endTime or 0.0)
+    outFiles = _shardFiles(ns2File, 'time', len(blocks))
+    jobs = [(ns2File, outFiles[k], blocks[k], cuts[k], cuts[k + 1]) for k in range(len(blocks))]
+    with Pool(processes or os.cpu_count()) as pool:
+        pool.starmap(_writeTimeShard, jobs)
+
+    shards = []
+    for k, outFile in enumerate(outFiles):
+        shards.append({'file': os.path.basename(outFile), 'begin': bounds[k], 'end': bounds[k + 1],
+                       'initialNodes': blocks[k].count(' set X_ '),
+                       'nodes': sorted(n for n in first if bounds[k] <= first[n] < bounds[k + 1] or first[n] < bounds[k] <= last[n])})
+    manifest = {'source': os.path.basename(ns2File), 'mode': 'time', 'windowLength': windowLength, 'shards': shards}
+    with open(manifestFileFor(ns2File, 'time'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+# Shard by an nx x ny grid over the initial node positions
+def shardByRegion(ns2File, nx, ny, processes=None):
+    first, last, initial, _ = scanNS2(ns2File)
+    xs = [p.get('X', 0.0) for p in initial.values()]
+    ys = [p.get('Y', 0.0) for p in initial.values()]
+    xmin, xmax, ymin, ymax = min(xs), max(xs), min(ys), max(ys)
+    cellW = (xmax - xmin) / nx or 1.0
+    cellH = (ymax - ymin) / ny or 1.0
+    regions = [[] for _ in range(nx * ny)]
+    for nid, p in initial.items():
+        cx = min(int((p.get('X', 0.0) - xmin) / cellW), nx - 1)
+        cy = min(int((p.get('Y', 0.0) - ymin) / cellH), ny - 1)
+        regions[cy * nx + cx].append(nid)
+
+    outFiles = _shardFiles(ns2File, 'region', len(regions))
+    jobs = [(ns2File, outFiles[k], regions[k]) for k in range(len(regions))]
+    with Pool(processes or os.cpu_count()) as pool:
+        pool.starmap(_writeRegionShard, jobs)
+
+    shards = []
+    for k, outFile in enumerate(outFiles):
+        cx, cy = k % nx, k // nx
+        shards.append({'file': os.path.basename(outFile),
+                       'region': [xmin + cx * cellW, ymin + cy * cellH, xmin + (cx + 1) * cellW, ymin + (cy + 1) * cellH],
+                       'nodes': sorted(regions[k])})
+    manifest = {'source': os.path.basename(ns2File), 'mode': 'region', 'grid': [nx, ny], 'shards': shards}
+    with open(manifestFileFor(ns2File, 'region'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+# Put the shards back together (time shards: byte identical to the source,
+# region shards: same events, ordered by time)
+def mergeShards(manifestFile, outFile):
+    with open(manifestFile) as f:
+        manifest = json.load(f)
+    folder = os.path.dirname(manifestFile)
+    files = [os.path.join(folder, s['file']) for s in manifest['shards']]
+    with open(outFile, 'w') as out:
+        if manifest['mode'] == 'time':
+            for shardFile in files:
+                with open(shardFile) as src:
+                    inState = False
+                    for line in src:
+                        if line == STATE_BEGIN:
+                            inState = True
+                        elif line == STATE_END:
+                            inState = False
+                        elif not inState:
+                            out.write(line)
+        else:
+            streams = [_timedGroups(shardFile) for shardFile in files]
+            for _, _, lines in heapq.merge(*streams):
+                out.writelines(lines)
+
+# Lines of a region shard grouped with the setdest they belong to, as (time, k, lines)
+def _timedGroups(shardFile):
+    with open(shardFile) as src:
+        group = []
+        k = 0
+        for line in src:
+            group.append(line)
+            if line.startswith('$ns_ at '):
+                yield _parseSetdest(line)[0], k, group
+                group = []
+                k += 1
+        if group:
+            yield math.inf, k, group
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+
+import json
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# Single streaming pass over an FCD trace (sumo --fcd-output). Each timestep
+# is handed to a list of consumers (format writers, analytics) so that NS2
+# conversion and statistics share one parse. Only per-vehicle state of the
+# vehicles that are currently in the simulation is kept in memory.
+
+# Step 1 - Stream the FCD Trace
+def iterFCD(traceFile):
+    context = ET.iterparse(traceFile, events=('start', 'end'))
+    _, root = next(context)
+    vehicles = []
+    for event, elem in context:
+        if event == 'start':
+            if elem.tag == 'timestep':
+                vehicles = []
+            continue
+        if elem.tag == 'vehicle':
+            vehicles.append(elem.attrib)
+        elif elem.tag == 'timestep':
+            yield elem.get('time'), vehicles
+            # Drop the parsed subtree so memory does not grow with the trace
+            root.clear()
+
+def streamTrace(traceFile, consumers):
+    for consumer in consumers:
+        consumer.begin()
+    pt = lt = -1
+    for time, vehicles in iterFCD(traceFile):
+        pt, lt = lt, float(time)
+        for consumer in consumers:
+            consumer.timestep(lt, vehicles)
+    # Like traceExporter.py, close the trace with an empty timestep one step after
+    # the last one, the vehicles still present leave (stop / destroy) there
+    for consumer in consumers:
+        consumer.timestep(lt - pt + lt, [])
+    for consumer in consumers:
+        consumer.end()
+
+# Keeps track of which vehicles are present, the same way traceExporter.py
+# does: a vehicle that disappears is removed and ignored if it comes back.
+class ActiveVehicles:
+    def __init__(self):
+        self.ids = {}
+        self.removed = set()
+        self.nextIndex = 0
+
+    # Returns [(index, isNew, attrib)] for the vehicles of this timestep and the ids that left
+    def update(self, vehicles):
+        seen = []
+        current = set()
+        for v in vehicles:
+            vid = v['id']
+            if vid in self.removed:
+                continue
+            isNew = vid not in self.ids
+            if isNew:
+                self.ids[vid] = self.nextIndex
+                self.nextIndex += 1
+            current.add(vid)
+            seen.append((self.ids[vid], isNew, v))
+        left = [vid for vid in self.ids if vid not in current]
+        for vid in left:
+            del self.ids[vid]
+            self.removed.add(vid)
+        return seen, left
+
+# Step 2 - NS2 Mobility Output (same output as traceExporter.py --ns2mobility-output)
+class NS2MobilityWriter:
+    def __init__(self, outFile):
+        self.outFile = outFile
+
+    def begin(self):
+        self.f = open(self.outFile, 'w')
+        self.active = ActiveVehicles()
+
+    def timestep(self, t, vehicles):
+        seen, _ = self.active.update(vehicles)
+        lines = []
+        for nid, isNew, v in seen:
+            x, y = float(v['x']), float(v['y'])
+            if isNew:
+                lines.append(f'$node_({nid}) set X_ {x}\n$node_({nid}) set Y_ {y}\n$node_({nid}) set Z_ 0\n')
+            lines.append(f'$ns_ at {t} "$node_({nid}) setdest {x} {y} {v["speed"]}"\n')
+        self.f.writelines(lines)
+
+    def end(self):
+        self.f.close()
+
+# Step 3 - Streaming Trace Analytics
+class TraceAnalytics:
+    def __init__(self, summaryFile, cellSize=100.0, timeBin=60.0, speedBins=np.arange(0.0, 51.0, 1.0)):
+        self.summaryFile = summaryFile
+        self.cellSize = cellSize
+        self.timeBin = timeBin
+        self.speedBins = speedBins
+
+    # Finished vehicles and completed density bins are spooled to temp files as
+    # JSON and copied into the summary at the end, so only the active vehicles,
+    # the histogram and the edge counters are kept in memory. A vehicle that
+    # leaves and comes back (e.g. after a teleport) gets a second record.
+    def begin(self):
+        self.active = {}            # id -> [depart, lastTime, distance, speedSum, samples, maxSpeed, lastX, lastY]
+        folder = os.path.dirname(os.path.abspath(self.summaryFile))
+        self.vehicleSpool = tempfile.TemporaryFile('w+', dir=folder)
+        self.densitySpool = tempfile.TemporaryFile('w+', dir=folder)
+        self.vehicles = 0
+        self.bins = 0
+        self.speedHist = np.zeros(len(self.speedBins) - 1, dtype=np.int64)
+        self.edgeIndex = {}
+        self.edgeSamples = np.zeros(0, dtype=np.int64)
+        self.binIndex = None
+        self.binCells = []          # (cells, counts) arrays of every timestep in the current bin
+        self.stepLength = None
+        self.lastTime = None
+        self.samples = 0
+
+    def _flushBin(self):
+        if self.binIndex is not None and self.binCells:
+            # Sum the counts per cell, cells in the order they were first seen
+            cells, first, inverse = np.unique(np.concatenate([c for c, _ in self.binCells]), axis=0, return_index=True, return_inverse=True)
+            counts = np.bincount(inverse.reshape(-1), weights=np.concatenate([n for _, n in self.binCells]), minlength=len(cells)).astype(np.int64)
+            order = np.argsort(first, kind='stable')
+            cells, counts = cells[order], counts[order]
+            record = {'bin': self.binIndex, 'cells': cells.tolist(), 'counts': counts.tolist()}
+            self.densitySpool.write((',' if self.bins else '') + json.dumps(record, separators=(',', ':')))
+            self.bins += 1
+        self.binCells = []
+
+    def _finish(self, vid):
+        d, a, dist, speedSum, n, mx = self.active.pop(vid)[:6]
+        record = {'id': vid, 'depart': float(d), 'arrival': float(a), 'distance': round(float(dist), 2),
+                  'meanSpeed': round(float(speedSum / n), 2), 'maxSpeed': float(mx)}
+        self.vehicleSpool.write((',' if self.vehicles else '') + json.dumps(record, separators=(',', ':')))
+        self.vehicles += 1
+
+    def timestep(self, t, vehicles):
+        if self.lastTime is not None and self.stepLength is None and t > self.lastTime:
+            self.stepLength = t - self.lastTime
+        self.lastTime = t
+
+        present = {v['id'] for v in vehicles}
+        for vid in [vid for vid in self.active if vid not in present]:
+            self._finish(vid)
+        if not vehicles:
+            return
+
+        x = np.array([float(v['x']) for v in vehicles])
+        y = np.array([float(v['y']) for v in vehicles])
+        speed = np.array([float(v['speed']) for v in vehicles])
+        self.samples += len(vehicles)
+
+        # Speed histogram (speeds above the last bin are counted in it)
+        self.speedHist += np.histogram(np.minimum(speed, self.speedBins[-1]), self.speedBins)[0]
+
+        # Per-edge occupancy in vehicle samples
+        edgeIds = []
+        for v in vehicles:
+            edge = v.get('lane', '').rsplit('_', 1)[0]
+            idx = self.edgeIndex.get(edge)
+            if idx is None:
+                idx = self.edgeIndex[edge] = len(self.edgeIndex)
+            edgeIds.append(idx)
+        counts = np.bincount(edgeIds, minlength=len(self.edgeIndex))
+        if len(self.edgeSamples) < len(counts):
+            self.edgeSamples = np.concatenate([self.edgeSamples, np.zeros(len(counts) - len(self.edgeSamples), dtype=np.int64)])
+        self.edgeSamples += counts
+
+        # Time-binned density on a square grid
+        binIndex = int(t // self.timeBin)
+        if binIndex != self.binIndex:
+            self._flushBin()
+            self.binIndex = binIndex
+        cells, cellCounts = np.unique(np.stack([np.floor(x / self.cellSize), np.floor(y / self.cellSize)], axis=1).astype(np.int64), axis=0, return_counts=True)
+        self.binCells.append((cells, cellCounts))
+
+        # Per-vehicle distance and speed statistics
+        for i, v in enumerate(vehicles):
+            s = self.active.get(v['id'])
+            if s is None:
+                self.active[v['id']] = [t, t, 0.0, speed[i], 1, speed[i], x[i], y[i]]
+                continue
+            s[2] += float(np.hypot(x[i] - s[6], y[i] - s[7]))
+            s[1] = t
+            s[3] += speed[i]
+            s[4] += 1
+            s[5] = max(s[5], speed[i])
+            s[6], s[7] = x[i], y[i]
+
+    def end(self):
+        for vid in list(self.active):
+            self._finish(vid)
+        self._flushBin()
+        stepLength = self.stepLength or 1.0
+        edges = sorted(self.edgeIndex, key=self.edgeIndex.get)
+        head = {
+            'vehicles': self.vehicles,
+            'samples': self.samples,
+            'stepLength': stepLength,
+            'speedHistogram': {'bins': self.speedBins.tolist(), 'counts': self.speedHist.tolist()},
+        }
+        edgeOccupancy = {e: float(n * stepLength) for e, n in zip(edges, self.edgeSamples.tolist()) if e}
+        density = {'cellSize': self.cellSize, 'timeBin': self.timeBin}
+        with open(self.summaryFile, 'w') as f:
+            f.write(json.dumps(head, separators=(',', ':'))[:-1] + ',"vehicleStats":[')
+            self.vehicleSpool.seek(0)
+            shutil.copyfileobj(self.vehicleSpool, f)
+            f.write('],"edgeOccupancy":' + json.dumps(edgeOccupancy, separators=(',', ':')))
+            f.write(',"density":' + json.dumps(density, separators=(',', ':'))[:-1] + ',"bins":[')
+            self.densitySpool.seek(0)
+            shutil.copyfileobj(self.densitySpool, f)
+            f.write(']}}')
+        self.vehicleSpool.close()
+        self.densitySpool.close()
+
+def summaryFileFor(traceFile):
+    base = traceFile[:-len('_trace.xml')] if traceFile.endswith('_trace.xml') else os.path.splitext(traceFile)[0]
+    return base + '_summary.json'
+
+# Convert the trace to NS2 and compute the analytics on the same parse
+def convertTraceWithAnalytics(traceFile, ns2File, summaryFile=None):
+    streamTrace(traceFile, [NS2MobilityWriter(ns2File), TraceAnalytics(summaryFile or summaryFileFor(traceFile))])